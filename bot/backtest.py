@@ -1,21 +1,29 @@
+import csv
 import os
 import time
-from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
+import numpy as np
 import pandas as pd
+import matplotlib
+matplotlib.use("Agg")  # backtest é CLI: sem backend interativo/display
 import matplotlib.pyplot as plt
 from loguru import logger
+from numba import njit
 
 from bot.config import load_config
 from bot.market_data import MarketDataService
-from bot.strategies import StrategyManager
-from bot.state import set_initial, set_last_tick_now, append_trade, is_recent_signal, add_recent_signal
+from bot.strategies import StrategyManager, SIGNAL_NAMES
+from bot.state import set_initial, set_last_tick_now, append_trade, try_claim_signal
 from bot.utils import normalize_symbol
 from bot.risk import RiskManager
 
 BINANCE_REST = "https://api.binance.com/api/v3/klines"
+REPORT_CSV = "data/backtest_report.csv"
+TRADE_FIELDS = ["t", "symbol", "side", "qty", "price", "pnl", "reason"]
 
 # ----- Suporte a CSV Binance -----
 BINANCE_CSV_HEADERS = {
@@ -28,38 +36,94 @@ BINANCE_CSV_HEADERS = {
     "close_time":["close_time", "Close time", "T"],
 }
 
-def _col(df: pd.DataFrame, names: List[str]) -> Optional[str]:
+_TIME_FIELDS = ("open_time", "close_time")
+
+def _col(columns, names: List[str]) -> Optional[str]:
     for n in names:
-        if n in df.columns:
+        if n in columns:
             return n
     return None
 
-def _df_to_kline_dicts(df: pd.DataFrame) -> List[dict]:
-    c_open_time  = _col(df, BINANCE_CSV_HEADERS["open_time"])
-    c_open       = _col(df, BINANCE_CSV_HEADERS["open"])
-    c_high       = _col(df, BINANCE_CSV_HEADERS["high"])
-    c_low        = _col(df, BINANCE_CSV_HEADERS["low"])
-    c_close      = _col(df, BINANCE_CSV_HEADERS["close"])
-    c_volume     = _col(df, BINANCE_CSV_HEADERS["volume"])
-    c_close_time = _col(df, BINANCE_CSV_HEADERS["close_time"])
-
-    if not all([c_open_time, c_open, c_high, c_low, c_close, c_volume]):
+def _resolve_columns(columns) -> Dict[str, Optional[str]]:
+    """
+    Mapeia cada campo canônico para o nome de coluna presente no CSV.
+    close_time é opcional; os demais são obrigatórios.
+    """
+    resolved = {field: _col(columns, names) for field, names in BINANCE_CSV_HEADERS.items()}
+    if not all(v for f, v in resolved.items() if f != "close_time"):
         raise RuntimeError("CSV não possui colunas obrigatórias.")
-
-    has_close_time = c_close_time is not None
-    out: List[dict] = []
-    for _, r in df.iterrows():
-        t_open = int(r[c_open_time])
-        o = float(r[c_open]); h = float(r[c_high]); l = float(r[c_low]); c = float(r[c_close]); v = float(r[c_volume])
-        T = int(r[c_close_time]) if has_close_time else (t_open + 60_000 - 1)
-        out.append({"t": t_open, "T": T, "o": f"{o:.8f}", "h": f"{h:.8f}", "l": f"{l:.8f}", "c": f"{c:.8f}", "v": f"{v:.8f}", "x": True})
-    return out
-
-def load_csv_klines(path: str) -> List[dict]:
-    df = pd.read_csv(path)
-    return _df_to_kline_dicts(df)
+    return resolved
+
+def _df_to_kline_arrays(df: pd.DataFrame, cols: Optional[Dict[str, Optional[str]]] = None) -> Dict[str, np.ndarray]:
+    """
+    Converte o DataFrame em colunas NumPy contíguas (SoA):
+    t/T em int64 e o/h/l/c/v em float64.
+    """
+    cols = cols or _resolve_columns(df.columns)
+    ot = df[cols["open_time"]].to_numpy(dtype=np.int64)
+    return {
+        "t": ot,
+        "T": df[cols["close_time"]].to_numpy(dtype=np.int64) if cols["close_time"] else ot + 59_999,
+        "o": df[cols["open"]].to_numpy(dtype=np.float64),
+        "h": df[cols["high"]].to_numpy(dtype=np.float64),
+        "l": df[cols["low"]].to_numpy(dtype=np.float64),
+        "c": df[cols["close"]].to_numpy(dtype=np.float64),
+        "v": df[cols["volume"]].to_numpy(dtype=np.float64),
+    }
+
+# resolução de cabeçalho por arquivo: path -> (mtime, colunas resolvidas)
+_HEADER_CACHE: Dict[str, tuple] = {}
+
+def _header_columns(path: str) -> Dict[str, Optional[str]]:
+    """
+    Resolve (uma vez por versão do arquivo) quais nomes de coluna o CSV usa.
+    Lê só a linha de cabeçalho e rejeita o arquivo antes do parse completo
+    se faltar alguma coluna obrigatória.
+    """
+    mtime = os.path.getmtime(path)
+    hit = _HEADER_CACHE.get(path)
+    if hit and hit[0] == mtime:
+        return hit[1]
+    cols = _resolve_columns(pd.read_csv(path, nrows=0).columns)
+    _HEADER_CACHE[path] = (mtime, cols)
+    return cols
+
+def _parse_csv_klines(path: str) -> Dict[str, np.ndarray]:
+    # lê só o cabeçalho para descobrir quais variantes de nome o arquivo usa,
+    # depois parseia apenas as 7 colunas necessárias com dtypes explícitos
+    cols = _header_columns(path)
+    used = {field: name for field, name in cols.items() if name}
+    dtype = {name: ("int64" if field in _TIME_FIELDS else "float64") for field, name in used.items()}
+    df = pd.read_csv(path, usecols=list(used.values()), dtype=dtype, engine="c", memory_map=True)
+    return _df_to_kline_arrays(df, cols)
+
+def load_csv_klines(path: str) -> Dict[str, np.ndarray]:
+    """
+    Carrega o CSV como colunas NumPy, usando um cache binário irmão
+    (<csv>.npz) enquanto ele for mais novo que o CSV.
+    """
+    cache = path + ".npz"
+    if os.path.exists(cache) and os.path.getmtime(cache) >= os.path.getmtime(path):
+        try:
+            with np.load(cache) as z:
+                return {k: z[k] for k in z.files}
+        except Exception as e:
+            logger.warning(f"Cache {cache} ilegível ({e}). Reprocessando CSV…")
+
+    data = _parse_csv_klines(path)
+    try:
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, **data)
+        os.replace(tmp, cache)
+    except OSError as e:
+        logger.warning(f"Não foi possível gravar cache {cache}: {e}")
+    return data
 
 # ----- Downloader público -----
+# sessão única com keep-alive: evita um handshake TLS por página (e é compartilhada pelas threads do _fetch_all)
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=16))
+
 def fetch_public_klines(symbol: str, interval: str, start_ms: int, end_ms: int, limit: int = 1000) -> List[List]:
     out: List[List] = []
     cur = int(start_ms)
@@ -67,7 +131,7 @@ def fetch_public_klines(symbol: str, interval: str, start_ms: int, end_ms: int,
 
     while True:
         params = {"symbol": sym, "interval": interval, "startTime": cur, "endTime": end_ms, "limit": limit}
-        r = requests.get(BINANCE_REST, params=params, timeout=30)
+        r = _SESSION.get(BINANCE_REST, params=params, timeout=30)
         r.raise_for_status()
         batch = r.json()
         if not batch:
@@ -80,18 +144,123 @@ def fetch_public_klines(symbol: str, interval: str, start_ms: int, end_ms: int,
         time.sleep(0.15)
     return out
 
-def klines_raw_to_closed_dicts(rows: List[List]) -> List[dict]:
-    return [
-        {"t": int(r[0]), "T": int(r[6]), "o": f"{float(r[1]):.8f}", "h": f"{float(r[2]):.8f}",
-         "l": f"{float(r[3]):.8f}", "c": f"{float(r[4]):.8f}", "v": f"{float(r[5]):.8f}", "x": True}
-        for r in rows
-    ]
+def klines_raw_to_arrays(rows: List[List]) -> Dict[str, np.ndarray]:
+    # a API REST devolve OHLCV em string; converte direto para colunas tipadas
+    arr = np.asarray([r[:7] for r in rows], dtype=np.float64).reshape(-1, 7)
+    return {
+        "t": arr[:, 0].astype(np.int64),
+        "T": arr[:, 6].astype(np.int64),
+        "o": arr[:, 1], "h": arr[:, 2], "l": arr[:, 3], "c": arr[:, 4], "v": arr[:, 5],
+    }
 
 def save_rows_as_csv(rows: List[List], csv_path: str):
     os.makedirs(os.path.dirname(csv_path), exist_ok=True)
     cols = ["open_time","open","high","low","close","volume","close_time","quote_volume","trades","taker_buy_base","taker_buy_quote","ignore"]
     pd.DataFrame(rows, columns=cols[:len(rows[0])]).to_csv(csv_path, index=False)
 
+# ----- Kernel compilado (SL/TP + sinais pré-calculados) -----
+_REASONS = ("ENTRY", "EXIT", "SL", "TP")
+
+@njit(cache=True)
+def _grow(a, n):
+    out = np.empty(n, dtype=a.dtype)
+    out[:len(a)] = a
+    return out
+
+@njit(cache=True)
+def _simulate_kernel(sched_sym, sched_idx, offsets, close, signals, n_strats,
+                     sl_ratio, tp_ratio, max_loss_abs, quote_per_trade):
+    """
+    Mesma lógica de BacktestEngine._step_symbol, sobre o plano cronológico.
+    close/signals são as colunas de todos os símbolos concatenadas (offsets[i]
+    = início do símbolo i); signals[k] é a k-ésima estratégia de cada símbolo.
+    Devolve os trades em arrays (sym, idx, side +1/-1, reason, qty, price, pnl)
+    e o pnl_daily final.
+    """
+    n_sym = len(offsets)
+    pos_qty = np.zeros(n_sym)
+    pos_price = np.zeros(n_sym)
+    pnl_daily = 0.0
+
+    cap = 1024
+    t_sym = np.empty(cap, dtype=np.int64)
+    t_idx = np.empty(cap, dtype=np.int64)
+    t_side = np.empty(cap, dtype=np.int8)
+    t_reason = np.empty(cap, dtype=np.int8)
+    t_qty = np.empty(cap, dtype=np.float64)
+    t_price = np.empty(cap, dtype=np.float64)
+    t_pnl = np.empty(cap, dtype=np.float64)
+    n = 0
+    per_step = n_strats.max() + 1 if n_sym else 1
+
+    for j in range(len(sched_sym)):
+        if n + per_step > cap:
+            cap *= 2
+            t_sym = _grow(t_sym, cap); t_idx = _grow(t_idx, cap)
+            t_side = _grow(t_side, cap); t_reason = _grow(t_reason, cap)
+            t_qty = _grow(t_qty, cap); t_price = _grow(t_price, cap); t_pnl = _grow(t_pnl, cap)
+
+        i = sched_sym[j]
+        idx = sched_idx[j]
+        g = offsets[i] + idx
+        price = close[g]
+
+        if pos_qty[i] > 0:
+            entry = pos_price[i]
+            reason = -1
+            if price <= entry * (1 - sl_ratio):
+                reason = 2
+            elif price >= entry * (1 + tp_ratio):
+                reason = 3
+            if reason >= 0:
+                qty = pos_qty[i]
+                pnl = (price - entry) * qty
+                pos_qty[i] = 0.0
+                pos_price[i] = 0.0
+                pnl_daily += pnl
+                t_sym[n] = i; t_idx[n] = idx; t_side[n] = -1; t_reason[n] = reason
+                t_qty[n] = qty; t_price[n] = price; t_pnl[n] = pnl
+                n += 1
+                continue
+
+        # antirrepique: o mesmo lado só vale uma vez por candle
+        seen_buy = False
+        seen_sell = False
+        for k in range(n_strats[i]):
+            sig = signals[k, g]
+            if sig == 1:
+                if seen_buy:
+                    continue
+                seen_buy = True
+            elif sig == -1:
+                if seen_sell:
+                    continue
+                seen_sell = True
+            else:
+                continue
+            if abs(pnl_daily) >= max_loss_abs:
+                continue
+
+            if sig == 1 and pos_qty[i] <= 0:
+                qty = quote_per_trade / price
+                pos_qty[i] = qty
+                pos_price[i] = price
+                t_sym[n] = i; t_idx[n] = idx; t_side[n] = 1; t_reason[n] = 0
+                t_qty[n] = qty; t_price[n] = price; t_pnl[n] = 0.0
+                n += 1
+            elif sig == -1 and pos_qty[i] > 0:
+                qty = pos_qty[i]
+                pnl = (price - pos_price[i]) * qty
+                pos_qty[i] = 0.0
+                pos_price[i] = 0.0
+                pnl_daily += pnl
+                t_sym[n] = i; t_idx[n] = idx; t_side[n] = -1; t_reason[n] = 1
+                t_qty[n] = qty; t_price[n] = price; t_pnl[n] = pnl
+                n += 1
+
+    return (t_sym[:n], t_idx[:n], t_side[:n], t_reason[:n],
+            t_qty[:n], t_price[:n], t_pnl[:n], pnl_daily)
+
 # ----- Engine -----
 class BacktestEngine:
     def __init__(self, cfg):
@@ -100,24 +269,42 @@ class BacktestEngine:
         self.interval = cfg.get("timeframe", "1m").strip()
         self.bt = cfg.get("backtest", {})
         self.cps = float(self.bt.get("candles_per_second", 20.0))
+        # replay em "tempo real" (limitado por candles_per_second) só quando pedido
+        self.realtime = bool(self.bt.get("realtime_replay", False))
         self.warmup = int(self.bt.get("warmup", 200))
         self.auto_save_csv = bool(self.bt.get("auto_save_csv", True))
+        csv_cfg = self.bt.get("csv", {})
+        self._csv_folder = csv_cfg.get("folder", "data/backtest")
+        self._csv_pattern = csv_cfg.get("pattern", "{symbol}_{interval}.csv")
+        os.makedirs(self._csv_folder, exist_ok=True)
 
         self.mds = MarketDataService(maxlen=10_000)
         self.strat_mgr = StrategyManager(cfg, self.mds)
         self.risk = RiskManager(cfg["risk"])
 
-        self.positions = defaultdict(lambda: {"qty": 0.0, "price": 0.0})
-        self.hist = {}
+        # posição por símbolo em slots fixos (índice = posição em self.symbols)
+        self._sym_idx = {s: i for i, s in enumerate(self.symbols)}
+        self.pos_qty = [0.0] * len(self.symbols)
+        self.pos_price = [0.0] * len(self.symbols)
+        # histórico por símbolo em colunas NumPy: {"t","T","o","h","l","c","v"}
+        self.hist: Dict[str, Dict[str, np.ndarray]] = {}
         self.pnl_daily = 0.0
         self.capital_inicial = float(self.bt.get("capital_inicial", 1000.0))
-        self.trades = []
+        # trades vão direto para REPORT_CSV durante o run (nada acumula em memória)
+        self.n_trades = 0
+        self._trade_file = None
+        self._trade_writer = None
+
+        # constantes do run, resolvidas uma vez (evita lookups/divisões por candle)
+        risk_cfg = cfg.get("risk", {})
+        self._sl_ratio = risk_cfg.get("stop_loss_pct", 0) / 100
+        self._tp_ratio = risk_cfg.get("take_profit_pct", 0) / 100
+        self._max_daily_loss_abs = (risk_cfg.get("max_daily_loss_pct", 0) / 100) * self.capital_inicial
+        self._quote_per_trade = self.risk.position_size_from_balance(self.capital_inicial)
+        self._strats_for = {s: list(cfg["strategies"].get(s, [])) for s in self.symbols}
 
     def _csv_path_for(self, symbol):
-        folder = self.bt.get("csv", {}).get("folder", "data/backtest")
-        pattern = self.bt.get("csv", {}).get("pattern", "{symbol}_{interval}.csv")
-        os.makedirs(folder, exist_ok=True)
-        return os.path.join(folder, pattern.format(symbol=symbol, interval=self.interval))
+        return os.path.join(self._csv_folder, self._csv_pattern.format(symbol=symbol, interval=self.interval))
 
     def _api_window_ms(self):
         api = self.bt.get("api", {})
@@ -127,106 +314,182 @@ class BacktestEngine:
         end_ms = int(time.time() * 1000)
         return end_ms - days * 86400000, end_ms
 
-    def _ensure_csv_or_download(self, symbol, path):
-        if os.path.exists(path):
-            return
-        logger.info(f"[{symbol}] CSV não encontrado, baixando...")
+    def _fetch_all(self, symbols) -> Dict[str, List[List]]:
+        """
+        Baixa os klines de vários símbolos em paralelo (I/O de rede domina;
+        cada worker mantém o próprio sleep entre páginas).
+        """
+        if not symbols:
+            return {}
         start_ms, end_ms = self._api_window_ms()
-        rows = fetch_public_klines(symbol, self.interval, start_ms, end_ms)
-        if not rows:
-            raise RuntimeError(f"[{symbol}] Sem dados na API pública.")
-        save_rows_as_csv(rows, path)
-        logger.info(f"[{symbol}] CSV salvo: {path} ({len(rows)} candles).")
+        with ThreadPoolExecutor(max_workers=min(len(symbols), 8)) as ex:
+            futures = {s: ex.submit(fetch_public_klines, s, self.interval, start_ms, end_ms) for s in symbols}
+            return {s: f.result() for s, f in futures.items()}
+
+    def _ensure_csvs_or_download(self, paths: Dict[str, str]):
+        missing = [s for s, p in paths.items() if not os.path.exists(p)]
+        for s in missing:
+            logger.info(f"[{s}] CSV não encontrado, baixando...")
+        for s, rows in self._fetch_all(missing).items():
+            if not rows:
+                raise RuntimeError(f"[{s}] Sem dados na API pública.")
+            save_rows_as_csv(rows, paths[s])
+            logger.info(f"[{s}] CSV salvo: {paths[s]} ({len(rows)} candles).")
 
     def load_data(self):
         source = (self.bt.get("source") or "csv").lower()
         logger.info(f"📦 Carregando dados p/ backtest (source={source}) | tf={self.interval} | symbols={self.symbols}")
-        for s in self.symbols:
-            if source == "csv":
-                p = self._csv_path_for(s)
-                if self.bt.get("auto_download_if_missing", True):
-                    self._ensure_csv_or_download(s, p)
-                self.hist[s] = load_csv_klines(p)
-            elif source == "api":
-                rows = fetch_public_klines(s, self.interval, *self._api_window_ms())
-                self.hist[s] = klines_raw_to_closed_dicts(rows)
-                if self.auto_save_csv:
+        if source == "csv":
+            paths = {s: self._csv_path_for(s) for s in self.symbols}
+            if self.bt.get("auto_download_if_missing", True):
+                self._ensure_csvs_or_download(paths)
+            for s in self.symbols:
+                self.hist[s] = load_csv_klines(paths[s])
+        elif source == "api":
+            for s, rows in self._fetch_all(self.symbols).items():
+                self.hist[s] = klines_raw_to_arrays(rows)
+                if self.auto_save_csv and rows:
                     save_rows_as_csv(rows, self._csv_path_for(s))
-            else:
-                raise RuntimeError("backtest.source deve ser 'csv' ou 'api'.")
-            logger.info(f"[{s}] Dados carregados ({len(self.hist[s])} candles)")
-            if len(self.hist[s]) <= self.warmup + 2:
+        else:
+            raise RuntimeError("backtest.source deve ser 'csv' ou 'api'.")
+
+        for s in self.symbols:
+            n = len(self.hist[s]["t"])
+            logger.info(f"[{s}] Dados carregados ({n} candles)")
+            if n <= self.warmup + 2:
                 raise RuntimeError(f"[{s}] Histórico insuficiente para warmup={self.warmup}.")
 
     def _bootstrap_warmup(self):
+        w = self.warmup
         for s in self.symbols:
-            for k in self.hist[s][:self.warmup]:
-                self.mds.on_kline_closed(s, self.interval, k)
+            h = self.hist[s]
+            self.mds.bulk_load(s, self.interval, h["t"][:w], h["o"][:w], h["h"][:w],
+                               h["l"][:w], h["c"][:w], h["v"][:w], h["T"][:w])
+
+    def _precompute_signals(self):
+        """
+        Estratégias path-independent (sinal só depende do histórico de closes)
+        têm a série inteira de sinais calculada de uma vez sobre as colunas
+        NumPy; as demais ficam com None e rodam generate_signal por candle.
+        """
+        self._signals = {}
+        self._signal_arrays = {}
+        self._needs_mds = {}
+        for s in self.symbols:
+            arrays = [self.strat_mgr.vectorized_signal(name, s, self.hist[s]["c"])
+                      for name in self._strats_for[s]]
+            entries = [(name, arr.tolist() if arr is not None else None)
+                       for name, arr in zip(self._strats_for[s], arrays)]
+            self._signal_arrays[s] = arrays
+            self._signals[s] = entries
+            # o buffer do MarketDataService só precisa ser alimentado se algo
+            # ainda depende de generate_signal
+            self._needs_mds[s] = any(sig is None for _, sig in entries)
+
+    def _run_kernel(self, schedule: np.ndarray):
+        """
+        Roda o plano inteiro no kernel compilado e registra os trades depois.
+        Só usado quando todas as estratégias de todos os símbolos são vetorizadas
+        (o pnl_daily é compartilhado entre símbolos, então é tudo ou nada).
+        """
+        lens = [len(self.hist[s]["c"]) for s in self.symbols]
+        offsets = np.concatenate([[0], np.cumsum(lens)[:-1]]).astype(np.int64)
+        close = np.concatenate([self.hist[s]["c"] for s in self.symbols])
+        n_strats = np.array([len(self._signal_arrays[s]) for s in self.symbols], dtype=np.int64)
+        signals = np.zeros((max(1, int(n_strats.max())), len(close)), dtype=np.int8)
+        for i, s in enumerate(self.symbols):
+            for k, arr in enumerate(self._signal_arrays[s]):
+                signals[k, offsets[i]:offsets[i] + lens[i]] = arr
+
+        t_sym, t_idx, t_side, t_reason, t_qty, t_price, t_pnl, pnl_daily = _simulate_kernel(
+            schedule["sym"], schedule["idx"], offsets, close, signals, n_strats,
+            float(self._sl_ratio), float(self._tp_ratio),
+            float(self._max_daily_loss_abs), float(self._quote_per_trade))
+
+        self.pnl_daily = float(pnl_daily)
+        for si, idx, side, reason, qty, price, pnl in zip(t_sym.tolist(), t_idx.tolist(), t_side.tolist(),
+                                                         t_reason.tolist(), t_qty.tolist(), t_price.tolist(),
+                                                         t_pnl.tolist()):
+            s = self.symbols[si]
+            self._record_trade(s, "buy" if side > 0 else "sell", qty, price, pnl, _REASONS[reason],
+                               int(self.hist[s]["t"][idx]))
+        set_last_tick_now()
 
-    def _record_trade(self, symbol, side, qty, price, pnl, reason):
-        self.trades.append({
-            "symbol": symbol, "side": side, "qty": qty,
+    def _record_trade(self, symbol, side, qty, price, pnl, reason, ts):
+        # ts = open_time (ms) do candle em que o trade ocorreu
+        self._trade_writer.writerow({
+            "t": ts, "symbol": symbol, "side": side, "qty": qty,
             "price": price, "pnl": pnl, "reason": reason
         })
-        append_trade(symbol, side, qty, price, pnl=pnl)
+        self.n_trades += 1
+        append_trade(symbol, side, qty, price, pnl=pnl, persist=False)
 
     def _step_symbol(self, symbol, idx):
-        k = self.hist[symbol][idx]
-        self.mds.on_kline_closed(symbol, self.interval, k)
-        price = float(k["c"])
+        h = self.hist[symbol]
+        price = h["c"][idx]
+        ts = int(h["t"][idx])
+        if self._needs_mds[symbol]:
+            self.mds.on_candle_closed(symbol, self.interval, h["t"][idx], h["o"][idx], h["h"][idx],
+                                      h["l"][idx], price, h["v"][idx], h["T"][idx])
         set_last_tick_now()
 
-        risk_cfg = self.cfg.get("risk", {})
-        stop_loss_pct = risk_cfg.get("stop_loss_pct", 0)
-        take_profit_pct = risk_cfg.get("take_profit_pct", 0)
-        max_daily_loss_pct = risk_cfg.get("max_daily_loss_pct", 0)
-
-        pos = self.positions[symbol]
-        if pos["qty"] > 0:
-            sl_price = pos["price"] * (1 - stop_loss_pct / 100)
-            tp_price = pos["price"] * (1 + take_profit_pct / 100)
-            if price <= sl_price:
-                pnl = (price - pos["price"]) * pos["qty"]
-                self.positions[symbol] = {"qty": 0.0, "price": 0.0}
-                self.pnl_daily += pnl
-                self._record_trade(symbol, "sell", pos["qty"], price, pnl, "SL")
-                return
-            elif price >= tp_price:
-                pnl = (price - pos["price"]) * pos["qty"]
-                self.positions[symbol] = {"qty": 0.0, "price": 0.0}
+        i = self._sym_idx[symbol]
+        pos_qty = self.pos_qty
+        pos_price = self.pos_price
+        if pos_qty[i] > 0:
+            entry, qty = pos_price[i], pos_qty[i]
+            reason = None
+            if price <= entry * (1 - self._sl_ratio):
+                reason = "SL"
+            elif price >= entry * (1 + self._tp_ratio):
+                reason = "TP"
+            if reason:
+                pnl = (price - entry) * qty
+                pos_qty[i] = pos_price[i] = 0.0
                 self.pnl_daily += pnl
-                self._record_trade(symbol, "sell", pos["qty"], price, pnl, "TP")
+                self._record_trade(symbol, "sell", qty, price, pnl, reason, ts)
                 return
 
-        for strat_name in self.cfg["strategies"].get(symbol, []):
-            signal = self.strat_mgr.get_strategy(strat_name, symbol).generate_signal()
+        for strat_name, series in self._signals[symbol]:
+            if series is not None:
+                signal = SIGNAL_NAMES[series[idx]]
+            else:
+                signal = self.strat_mgr.signal(strat_name, symbol)
             if signal in ["buy", "sell"]:
-                if is_recent_signal(symbol, signal, idx):
+                if not try_claim_signal(symbol, signal, idx):
                     continue
-                add_recent_signal(symbol, signal, idx)
-                if abs(self.pnl_daily) >= (max_daily_loss_pct / 100) * self.capital_inicial:
+                if abs(self.pnl_daily) >= self._max_daily_loss_abs:
                     continue
 
-                if signal == "buy" and pos["qty"] <= 0:
-                    qty_usdt = self.risk.position_size_from_balance(self.capital_inicial)
-                    qty = qty_usdt / price
-                    self.positions[symbol] = {"qty": qty, "price": price}
-                    self._record_trade(symbol, "buy", qty, price, 0.0, "ENTRY")
-                elif signal == "sell" and pos["qty"] > 0:
-                    pnl = (price - pos["price"]) * pos["qty"]
-                    self.positions[symbol] = {"qty": 0.0, "price": 0.0}
+                if signal == "buy" and pos_qty[i] <= 0:
+                    qty = self._quote_per_trade / price
+                    pos_qty[i], pos_price[i] = qty, price
+                    self._record_trade(symbol, "buy", qty, price, 0.0, "ENTRY", ts)
+                elif signal == "sell" and pos_qty[i] > 0:
+                    qty = pos_qty[i]
+                    pnl = (price - pos_price[i]) * qty
+                    pos_qty[i] = pos_price[i] = 0.0
                     self.pnl_daily += pnl
-                    self._record_trade(symbol, "sell", pos["qty"], price, pnl, "EXIT")
+                    self._record_trade(symbol, "sell", qty, price, pnl, "EXIT", ts)
+
+    def _open_trade_stream(self):
+        os.makedirs(os.path.dirname(REPORT_CSV), exist_ok=True)
+        self._trade_file = open(REPORT_CSV, "w", newline="")
+        self._trade_writer = csv.DictWriter(self._trade_file, fieldnames=TRADE_FIELDS)
+        self._trade_writer.writeheader()
+
+    def _close_trade_stream(self):
+        if self._trade_file:
+            self._trade_file.close()
+            self._trade_file = None
 
     def _generate_report(self):
-        if not self.trades:
+        if not self.n_trades:
             logger.info("Nenhum trade para reportar.")
             return
 
-        df = pd.DataFrame(self.trades)
-        os.makedirs("data", exist_ok=True)
-        csv_path = "data/backtest_report.csv"
-        df.to_csv(csv_path, index=False)
+        csv_path = REPORT_CSV
+        df = pd.read_csv(csv_path)
 
         total_trades = len(df)
         wins = df[df["pnl"] > 0]
@@ -240,85 +503,105 @@ class BacktestEngine:
         logger.info(f"PnL Médio: {avg_pnl:.2f} | Máx. Drawdown: {drawdown:.2f}")
 
         # --- Gráficos ---
-        equity = df["pnl"].cumsum()
-        plt.figure(figsize=(10, 6))
-        plt.plot(equity, label="Equity Curve", color="blue")
-        plt.title("Evolução do Capital (Equity Curve)")
-        plt.xlabel("Trade #")
-        plt.ylabel("Capital acumulado (USDT)")
-        plt.legend()
-        plt.grid(True)
-        plt.savefig("data/equity_curve.png")
-        plt.close()
-
-        plt.figure(figsize=(10, 6))
-        plt.bar(range(len(df)), df["pnl"], color=["green" if x > 0 else "red" for x in df["pnl"]])
-        plt.title("PnL por Trade")
-        plt.xlabel("Trade #")
-        plt.ylabel("PnL (USDT)")
-        plt.grid(True)
-        plt.savefig("data/pnl_per_trade.png")
-        plt.close()
-
-        plt.figure(figsize=(10, 6))
-        plt.hist(df["pnl"], bins=20, color="purple", alpha=0.7)
-        plt.title("Distribuição de PnL")
-        plt.xlabel("PnL")
-        plt.ylabel("Frequência")
-        plt.grid(True)
-        plt.savefig("data/pnl_distribution.png")
-        plt.close()
-
-        self._generate_price_chart(df)
+        # uma única figura reaproveitada (ax.clear) para todos os gráficos
+        fig, ax = plt.subplots(figsize=(10, 6))
+        try:
+            equity = df["pnl"].cumsum()
+            ax.plot(equity, label="Equity Curve", color="blue")
+            ax.set_title("Evolução do Capital (Equity Curve)")
+            ax.set_xlabel("Trade #")
+            ax.set_ylabel("Capital acumulado (USDT)")
+            ax.legend()
+            ax.grid(True)
+            fig.savefig("data/equity_curve.png")
+
+            ax.clear()
+            ax.bar(range(len(df)), df["pnl"], color=np.where(df["pnl"].to_numpy() > 0, "green", "red"))
+            ax.set_title("PnL por Trade")
+            ax.set_xlabel("Trade #")
+            ax.set_ylabel("PnL (USDT)")
+            ax.grid(True)
+            fig.savefig("data/pnl_per_trade.png")
+
+            ax.clear()
+            ax.hist(df["pnl"], bins=20, color="purple", alpha=0.7)
+            ax.set_title("Distribuição de PnL")
+            ax.set_xlabel("PnL")
+            ax.set_ylabel("Frequência")
+            ax.grid(True)
+            fig.savefig("data/pnl_distribution.png")
+
+            self._generate_price_chart(df, fig, ax)
+        finally:
+            plt.close(fig)
         logger.info("📈 Gráficos salvos em data/")
 
-    def _generate_price_chart(self, df_trades):
+    def _generate_price_chart(self, df_trades, fig, ax):
         symbol = self.symbols[0]
-        prices = [float(k["c"]) for k in self.hist[symbol]]
-        times = [pd.to_datetime(k["t"], unit="ms") for k in self.hist[symbol]]
-
-        plt.figure(figsize=(14, 7))
-        plt.plot(times, prices, label=f"Preço {symbol}", color="blue", alpha=0.6)
-
-        for _, row in df_trades.iterrows():
-            trade_idx = min(range(len(prices)), key=lambda i: abs(prices[i] - row["price"]))
-            color = "green" if row["side"] == "buy" else "red"
-            marker = "^" if row["side"] == "buy" else "v"
-            plt.scatter(times[trade_idx], row["price"], color=color, marker=marker, s=120)
-            plt.text(times[trade_idx], row["price"], row["reason"], fontsize=8, ha="center",
-                     va="bottom" if row["side"] == "buy" else "top")
-
-        plt.title(f"Trades no par {symbol}")
-        plt.xlabel("Tempo")
-        plt.ylabel("Preço (USDT)")
-        plt.legend()
-        plt.grid(True)
-        plt.savefig("data/trades_chart.png")
-        plt.close()
+        prices = self.hist[symbol]["c"]
+        times = pd.to_datetime(self.hist[symbol]["t"], unit="ms")
+
+        ax.clear()
+        fig.set_size_inches(14, 7)
+        ax.plot(times, prices, label=f"Preço {symbol}", color="blue", alpha=0.6)
+
+        # casa cada trade com o seu candle pelo timestamp (busca binária), em vez
+        # de procurar o preço mais próximo em todo o histórico
+        trades = df_trades[df_trades["symbol"] == symbol]
+        pos = np.searchsorted(self.hist[symbol]["t"], trades["t"].to_numpy())
+        pos = np.clip(pos, 0, len(times) - 1)
+        is_buy = (trades["side"] == "buy").to_numpy()
+        trade_prices = trades["price"].to_numpy()
+        ax.scatter(times[pos[is_buy]], trade_prices[is_buy], color="green", marker="^", s=120)
+        ax.scatter(times[pos[~is_buy]], trade_prices[~is_buy], color="red", marker="v", s=120)
+        for p, price, reason, buy in zip(pos.tolist(), trade_prices.tolist(), trades["reason"], is_buy.tolist()):
+            ax.text(times[p], price, reason, fontsize=8, ha="center", va="bottom" if buy else "top")
+
+        ax.set_title(f"Trades no par {symbol}")
+        ax.set_xlabel("Tempo")
+        ax.set_ylabel("Preço (USDT)")
+        ax.legend()
+        ax.grid(True)
+        fig.savefig("data/trades_chart.png")
+
+    def _build_schedule(self) -> np.ndarray:
+        """
+        Plano de iteração único: (ts, índice do símbolo, índice local) de todos
+        os candles pós-warmup, em ordem cronológica (empate segue a ordem de symbols).
+        """
+        w = self.warmup
+        ts = np.concatenate([self.hist[s]["t"][w:] for s in self.symbols])
+        si = np.concatenate([np.full(len(self.hist[s]["t"]) - w, i, dtype=np.int64)
+                             for i, s in enumerate(self.symbols)])
+        li = np.concatenate([np.arange(w, len(self.hist[s]["t"]), dtype=np.int64) for s in self.symbols])
+        order = np.lexsort((si, ts))
+        return np.rec.fromarrays([ts[order], si[order], li[order]], names="ts,sym,idx")
 
     def run(self):
         set_initial("backtest", self.symbols)
         self.load_data()
         self._bootstrap_warmup()
-
-        ptr = {s: self.warmup for s in self.symbols}
-        cps_sleep = (1.0 / self.cps) if self.cps > 0 else 0.0
-        logger.info("🚀 Iniciando backtest acelerado.")
-        steps = 0
-        while True:
-            active = False
-            for s in self.symbols:
-                if ptr[s] < len(self.hist[s]):
-                    self._step_symbol(s, ptr[s])
-                    ptr[s] += 1
-                    active = True
-            if not active:
-                break
-            steps += 1
-            if cps_sleep > 0:
-                time.sleep(cps_sleep)
-            elif steps % 5000 == 0:
-                time.sleep(0.001)
+        self._precompute_signals()
+
+        schedule = self._build_schedule()
+        cps_sleep = (1.0 / self.cps) if (self.realtime and self.cps > 0) else 0.0
+        self._open_trade_stream()
+        try:
+            if not cps_sleep and not any(self._needs_mds.values()):
+                logger.info("🚀 Iniciando backtest vetorizado (kernel compilado).")
+                self._run_kernel(schedule)
+            else:
+                logger.info("🚀 Iniciando backtest " + ("em replay (tempo real)." if cps_sleep else "acelerado."))
+                prev_ts = None
+                symbols = self.symbols
+                for ts, si, li in schedule.tolist():
+                    # um "passo" = todos os símbolos com candle no mesmo timestamp
+                    if cps_sleep and ts != prev_ts and prev_ts is not None:
+                        time.sleep(cps_sleep)
+                    prev_ts = ts
+                    self._step_symbol(symbols[si], li)
+        finally:
+            self._close_trade_stream()
 
         logger.info(f"✅ Backtest finalizado | PnL diário: {self.pnl_daily:.2f} USDT")
         self._generate_report()
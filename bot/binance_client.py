@@ -1,42 +1,240 @@
+import atexit
+import functools
+import json
+import os
+import random
 import time
-from typing import Dict, Any, Callable
-from binance.client import Client
+from dataclasses import asdict, dataclass
+from typing import Dict, Any, Callable, List, Optional, Sequence, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from binance.client import AsyncClient, Client
 from binance.enums import *
+from binance.exceptions import BinanceAPIException, BinanceRequestException
 from loguru import logger
 from bot.config import load_config
-from bot.utils import round_step, round_tick, gen_client_order_id, normalize_symbol
+from bot.utils import (round_step, round_tick, gen_client_order_id, normalize_symbol, ttl_cache,
+                       CircuitBreaker, CircuitOpenError)
+
+EXCHANGE_INFO_PATH = os.getenv("BOT_EXCHANGE_INFO_PATH", "data/exchange_info.json")
+EXCHANGE_INFO_TTL = 24 * 3600  # segundos
+
+# pool HTTP único do processo: cada Client tem a sua Session (headers/API key
+# próprios), mas todas montam o mesmo adapter e reaproveitam as conexões
+# keep-alive (sem novo handshake TCP/TLS por instância). Retries ficam no _with_retries.
+_ADAPTER = HTTPAdapter(pool_connections=20, pool_maxsize=100, max_retries=0)
+
+class PooledClient(Client):
+    """Client do python-binance com Session própria sobre o _ADAPTER compartilhado."""
+    def _init_session(self) -> requests.Session:
+        session = requests.Session()
+        session.headers.update(self._get_headers())
+        session.mount("https://", _ADAPTER)
+        return session
+
+    def close_connection(self):
+        # fecha só a Session desta instância; o pool é do processo e segue aberto
+        if self.session:
+            self.session.adapters.pop("https://", None)
+            self.session.close()
+
+def _retry_kind(e: Exception) -> Optional[str]:
+    """
+    Classifica a falha para o _with_retries:
+      "rejected" -> a Binance recusou sem executar (rate limit/ban): seguro reenviar
+      "unknown"  -> timeout/erro de rede/5xx: a requisição pode ter sido executada
+      None       -> erro definitivo (parâmetro inválido, saldo, etc.): não retentar
+    """
+    if isinstance(e, BinanceAPIException):
+        if e.status_code in (418, 429) or e.code == -1003:
+            return "rejected"
+        if e.status_code >= 500 or e.code in (-1001, -1007):
+            return "unknown"
+        return None
+    if isinstance(e, (BinanceRequestException, requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return "unknown"
+    return None
+
+@dataclass(slots=True, frozen=True)
+class SymbolFilters:
+    """Filtros de negociação de um par (LOT_SIZE / PRICE_FILTER / MIN_NOTIONAL) já em float."""
+    stepSize: float
+    minQty: float
+    tickSize: float
+    minNotional: float
+
+def _parse_filters(info: Dict[str, Any]) -> SymbolFilters:
+    f = {i['filterType']: i for i in info['filters']}
+    return SymbolFilters(
+        stepSize=float(f['LOT_SIZE']['stepSize']),
+        minQty=float(f['LOT_SIZE']['minQty']),
+        tickSize=float(f['PRICE_FILTER']['tickSize']),
+        minNotional=float(f.get('MIN_NOTIONAL', {}).get('minNotional', 0.0)),
+    )
+
+def _conform(flt: SymbolFilters, qty: float, price: float) -> Tuple[float, float]:
+    qty2 = max(round_step(float(qty), flt.stepSize), flt.minQty)
+    price2 = round_tick(float(price), flt.tickSize)
+    return qty2, price2
+
+def _filters_from_exchange_info(info: Dict[str, Any]) -> Dict[str, SymbolFilters]:
+    filters = {}
+    for sym in info.get("symbols", []):
+        try:
+            filters[sym["symbol"]] = _parse_filters(sym)
+        except (KeyError, ValueError):
+            continue
+    return filters
+
+def _load_exchange_filters(testnet: bool) -> Optional[Dict[str, SymbolFilters]]:
+    """Filtros persistidos em EXCHANGE_INFO_PATH, se forem do mesmo ambiente e tiverem < 24h."""
+    try:
+        with open(EXCHANGE_INFO_PATH, "r") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get("testnet") != testnet or time.time() - float(data.get("ts", 0)) > EXCHANGE_INFO_TTL:
+        return None
+    try:
+        return {sym: SymbolFilters(**flt) for sym, flt in data.get("filters", {}).items()}
+    except TypeError:
+        return None  # formato antigo/corrompido: recarrega da API
+
+def _save_exchange_filters(testnet: bool, filters: Dict[str, SymbolFilters]):
+    try:
+        os.makedirs(os.path.dirname(EXCHANGE_INFO_PATH) or ".", exist_ok=True)
+        tmp = EXCHANGE_INFO_PATH + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"ts": int(time.time()), "testnet": testnet,
+                       "filters": {sym: asdict(flt) for sym, flt in filters.items()}}, f)
+        os.replace(tmp, EXCHANGE_INFO_PATH)
+    except OSError as e:
+        logger.warning(f"Não foi possível persistir exchangeInfo: {e}")
+
+def _select_filters(filters: Dict[str, SymbolFilters], wanted: Optional[set]) -> Dict[str, SymbolFilters]:
+    return filters if wanted is None else {s: filters[s] for s in wanted if s in filters}
+
+def _symbol_key(symbol: str) -> str:
+    # chave dos ttl_cache por símbolo: "btc/usdt" e "BTCUSDT" são a mesma entrada
+    return normalize_symbol(symbol)
 
 class BinanceClient:
     """
     Camada fina sobre python-binance com:
-    - cache de exchangeInfo por símbolo
+    - cache de exchangeInfo por símbolo (aquecido no start, persistido em disco por 24h)
     - helpers para arredondamento conforme filtros
     - helpers de ordem MARKET por qty ou quoteOrderQty
     - retries com backoff exponencial e jitter
     """
-    _filters_cache: Dict[str, Dict[str, float]] = {}
-
     def __init__(self):
         config = load_config()
-        self.client = Client(config['binance_api_key'], config['binance_api_secret'])
+        self.client = PooledClient(config['binance_api_key'], config['binance_api_secret'])
         self.client.API_URL = config['binance_api_url']
         self.testnet = bool(config.get('testnet'))
         ambiente = 'TESTNET' if self.testnet else 'PRODUÇÃO'
         logger.info(f"🔧 Conectando na Binance SPOT {ambiente}")
+        # falha rápido durante indisponibilidade da API em vez de empilhar retries
+        self.breaker = CircuitBreaker("binance")
+        # cache por instância (nada de estado mutável compartilhado via classe)
+        self._filters_cache: Dict[str, SymbolFilters] = {}
+        self.warm_filters(config.get('symbols'))
+
+    def close(self):
+        try:
+            self.client.close_connection()
+        except Exception as e:
+            logger.warning(f"Falha ao fechar sessão Binance: {e}")
+
+    # --------- exchangeInfo ---------
+    def warm_filters(self, symbols: Optional[Sequence[str]] = None):
+        """
+        Preenche _filters_cache dos símbolos pedidos (todos, se None) com uma
+        única chamada exchangeInfo (ou do arquivo em disco, se tiver < 24h),
+        evitando um round-trip por símbolo na primeira ordem.
+        """
+        wanted = {normalize_symbol(s) for s in symbols} if symbols else None
+        if wanted is not None and wanted <= self._filters_cache.keys():
+            return
+        filters = _load_exchange_filters(self.testnet)
+        if filters is None:
+            try:
+                filters = _filters_from_exchange_info(self._with_retries(self.client.get_exchange_info))
+            except Exception as e:
+                logger.warning(f"Falha ao carregar exchangeInfo ({e}). Filtros serão buscados sob demanda.")
+                return
+            _save_exchange_filters(self.testnet, filters)
+        self._filters_cache.update(_select_filters(filters, wanted))
 
     # --------- retry wrapper ---------
-    def _with_retries(self, fn: Callable, *args, _retries: int = 5, _base_sleep: float = 0.5, **kwargs):
+    def _with_retries(self, fn: Callable, *args, _retries: int = 5, _base_sleep: float = 0.5,
+                      _idempotent: bool = True, **kwargs):
+        """
+        Retenta só falhas transitórias, com backoff "full jitter" (sleep uniforme
+        em [0, min(8s, base*2^n)]) para não sincronizar retries entre símbolos.
+        Cada falha transitória conta no circuit breaker; com o circuito aberto
+        a chamada falha na hora com CircuitOpenError.
+        _idempotent=False (criação de ordem): antes de reenviar, confere pelo
+        newClientOrderId se a tentativa anterior já executou; sem como conferir,
+        uma falha de status desconhecido não é retentada (evita ordem em dobro).
+        """
         attempt = 0
         while True:
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"Binance indisponível (circuito aberto): {fn.__name__} não enviada.")
             try:
-                return fn(*args, **kwargs)
-            except Exception as e:
+                if attempt and not _idempotent:
+                    landed = self._find_order(fn, kwargs)
+                    if landed is not None:
+                        logger.warning(f"{fn.__name__}: tentativa anterior já executou "
+                                       f"({kwargs.get('newClientOrderId')}). Sem reenviar.")
+                        self.breaker.record_success()
+                        return landed
+                result = fn(*args, **kwargs)
+                self.breaker.record_success()
+                return result
+            except (BinanceAPIException, BinanceRequestException, requests.exceptions.RequestException) as e:
+                kind = _retry_kind(e)
+                if kind is None:
+                    if isinstance(e, BinanceAPIException):
+                        self.breaker.record_success()  # a API respondeu: erro é do pedido, não do serviço
+                    else:
+                        self.breaker.release()
+                    raise
+                self.breaker.record_failure()
+                if self.breaker.state == CircuitBreaker.OPEN:
+                    raise
+                if kind == "unknown" and not _idempotent and not self._can_lookup(fn, kwargs):
+                    raise
                 attempt += 1
                 if attempt > _retries:
                     raise
-                sleep = min(8.0, _base_sleep * (2 ** (attempt - 1))) + (0.05 * attempt)
+                sleep = random.random() * min(8.0, _base_sleep * (2 ** attempt))
                 logger.warning(f"[retry {attempt}/{_retries}] {fn.__name__} falhou: {e}. Dormindo {sleep:.2f}s…")
                 time.sleep(sleep)
+            except BaseException:
+                # qualquer outra exceção (ValueError de corpo inválido, etc.): sem
+                # veredito, mas nunca deixa o half-open preso com _probing=True
+                self.breaker.release()
+                raise
+
+    def _can_lookup(self, fn: Callable, kwargs: Dict[str, Any]) -> bool:
+        return fn == self.client.create_order and "newClientOrderId" in kwargs
+
+    def _find_order(self, fn: Callable, kwargs: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Ordem já criada com o mesmo newClientOrderId, ou None se não existir."""
+        if not self._can_lookup(fn, kwargs):
+            return None
+        try:
+            order = self.client.get_order(symbol=kwargs["symbol"], origClientOrderId=kwargs["newClientOrderId"])
+        except BinanceAPIException as e:
+            if e.code == -2013:  # Order does not exist
+                return None
+            raise
+        # get_order não traz fills: reconstrói um fill médio para quem agrega execução
+        qty = float(order.get("executedQty", 0))
+        if qty > 0 and not order.get("fills"):
+            order["fills"] = [{"qty": str(qty), "price": str(float(order.get("cummulativeQuoteQty", 0)) / qty)}]
+        return order
 
     # ========= Market data =========
     def get_balance(self, asset: str) -> float:
@@ -49,10 +247,22 @@ class BinanceClient:
         symbol = normalize_symbol(symbol)
         return self._with_retries(self.client.get_klines, symbol=symbol, interval=interval, limit=limit)
 
+    @ttl_cache(ttl=1.0, key=_symbol_key)
     def get_ticker(self, symbol: str) -> Dict[str, Any]:
+        # TTL curto: várias consultas de preço dentro da mesma execução viram uma só chamada REST
         symbol = normalize_symbol(symbol)
         return self._with_retries(self.client.get_ticker, symbol=symbol)
 
+    def get_symbol_price(self, symbol: str) -> float:
+        """Último preço via /ticker/price (payload bem menor que o ticker 24h)."""
+        symbol = normalize_symbol(symbol)
+        return float(self._with_retries(self.client.get_symbol_ticker, symbol=symbol)['price'])
+
+    def get_all_prices(self) -> Dict[str, float]:
+        """Último preço de todos os símbolos numa única chamada /ticker/price."""
+        return {t['symbol']: float(t['price']) for t in self._with_retries(self.client.get_all_tickers)}
+
+    @ttl_cache(ttl=3600.0, key=_symbol_key)
     def get_symbol_info(self, symbol: str) -> Dict[str, Any]:
         symbol = normalize_symbol(symbol)
         return self._with_retries(self.client.get_symbol_info, symbol=symbol)
@@ -61,45 +271,51 @@ class BinanceClient:
         symbol = normalize_symbol(symbol)
         return self._with_retries(self.client.get_my_trades, symbol=symbol, limit=limit)
 
+    def get_my_trades_since(self, symbol: str, from_id: int, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Todos os trades com id > from_id (paginando por fromId), em ordem crescente."""
+        symbol = normalize_symbol(symbol)
+        out: List[Dict[str, Any]] = []
+        cur = int(from_id) + 1
+        while True:
+            batch = self._with_retries(self.client.get_my_trades, symbol=symbol, fromId=cur, limit=limit)
+            out.extend(batch)
+            if len(batch) < limit:
+                return out
+            cur = int(batch[-1]["id"]) + 1
+
     # ========= Exchange filters =========
-    def get_symbol_filters(self, symbol: str) -> Dict[str, float]:
+    def get_symbol_filters(self, symbol: str) -> SymbolFilters:
         symbol = normalize_symbol(symbol)
         if symbol in self._filters_cache:
             return self._filters_cache[symbol]
         info = self.get_symbol_info(symbol)
         if not info:
             raise RuntimeError(f"symbol info not found: {symbol}")
-        f = {i['filterType']: i for i in info['filters']}
-        data = {
-            'stepSize': float(f['LOT_SIZE']['stepSize']),
-            'minQty': float(f['LOT_SIZE']['minQty']),
-            'tickSize': float(f['PRICE_FILTER']['tickSize']),
-            'minNotional': float(f.get('MIN_NOTIONAL', {}).get('minNotional', 0.0)),
-        }
+        data = _parse_filters(info)
         self._filters_cache[symbol] = data
         return data
 
     def conform_qty_price(self, symbol: str, qty: float, price: float) -> (float, float):
-        flt = self.get_symbol_filters(symbol)
-        qty2 = max(round_step(float(qty), flt['stepSize']), flt['minQty'])
-        price2 = round_tick(float(price), flt['tickSize'])
-        return qty2, price2
+        return _conform(self.get_symbol_filters(symbol), qty, price)
 
     # ========= Orders =========
-    def create_market_order_qty(self, symbol: str, side: str, quantity: float) -> Dict[str, Any]:
+    def create_market_order_qty(self, symbol: str, side: str, quantity: float,
+                                ref_price: Optional[float] = None) -> Dict[str, Any]:
         """
         Cria ordem MARKET por quantidade (base asset). Faz arredondamento + valida notional.
+        ref_price: preço recente já conhecido pelo chamador (ex.: close do candle);
+        sem ele, busca o último preço via get_symbol_price.
         """
         symbol = normalize_symbol(symbol)
         side_binance = SIDE_BUY if side == "buy" else SIDE_SELL
         # Checa notional com último preço (estimativa)
-        book = self.get_ticker(symbol)
-        last_price = float(book['lastPrice'])
+        last_price = float(ref_price) if ref_price else self.get_symbol_price(symbol)
         qty_adj, _ = self.conform_qty_price(symbol, quantity, last_price)
-        if qty_adj * last_price < self.get_symbol_filters(symbol)['minNotional']:
+        if qty_adj * last_price < self.get_symbol_filters(symbol).minNotional:
             raise RuntimeError(f"MIN_NOTIONAL não atendido para {symbol}. qty={qty_adj}, price={last_price}")
         order = self._with_retries(
             self.client.create_order,
+            _idempotent=False,
             symbol=symbol,
             side=side_binance,
             type=ORDER_TYPE_MARKET,
@@ -117,10 +333,11 @@ class BinanceClient:
         side_binance = SIDE_BUY if side == "buy" else SIDE_SELL
         # quoteOrderQty precisa respeitar MIN_NOTIONAL
         flt = self.get_symbol_filters(symbol)
-        if quote_qty_usdt < flt['minNotional']:
-            raise RuntimeError(f"quoteOrderQty < MIN_NOTIONAL para {symbol}: {quote_qty_usdt} < {flt['minNotional']}")
+        if quote_qty_usdt < flt.minNotional:
+            raise RuntimeError(f"quoteOrderQty < MIN_NOTIONAL para {symbol}: {quote_qty_usdt} < {flt.minNotional}")
         order = self._with_retries(
             self.client.create_order,
+            _idempotent=False,
             symbol=symbol,
             side=side_binance,
             type=ORDER_TYPE_MARKET,
@@ -139,6 +356,7 @@ class BinanceClient:
         _, limit_price_adj = self.conform_qty_price(symbol, quantity, limit_price)
         return self._with_retries(
             self.client.create_oco_order,
+            _idempotent=False,
             symbol=symbol,
             side=SIDE_SELL,
             quantity=qty_adj,
@@ -148,3 +366,77 @@ class BinanceClient:
             stopLimitTimeInForce=TIME_IN_FORCE_GTC,
             newClientOrderId=gen_client_order_id("oco")
         )
+
+@functools.lru_cache(maxsize=1)
+def get_binance_client() -> BinanceClient:
+    """
+    BinanceClient único do processo: execução, IA e bootstrap compartilham o
+    mesmo Client, pool HTTP, circuit breaker e cache de filtros.
+    """
+    client = BinanceClient()
+    atexit.register(client.close)
+    return client
+
+class AsyncBinanceClient:
+    """
+    Par assíncrono do BinanceClient (python-binance AsyncClient, sobre aiohttp)
+    para buscar market data de vários símbolos em paralelo: o tempo total vira
+    o do RTT mais lento, não a soma. Os filtros vêm do mesmo exchangeInfo
+    persistido em disco pelo BinanceClient. Ordens continuam só no
+    BinanceClient (retry, circuit breaker e conferência por newClientOrderId).
+    """
+    def __init__(self, client: AsyncClient, filters_cache: Optional[Dict[str, SymbolFilters]] = None,
+                 testnet: bool = False):
+        self.client = client
+        self.testnet = testnet
+        self._filters_cache = filters_cache if filters_cache is not None else {}
+
+    @classmethod
+    async def create(cls, filters_cache: Optional[Dict[str, SymbolFilters]] = None) -> "AsyncBinanceClient":
+        config = load_config()
+        client = await AsyncClient.create(config['binance_api_key'], config['binance_api_secret'])
+        client.API_URL = config['binance_api_url']
+        return cls(client, filters_cache, testnet=bool(config.get('testnet')))
+
+    async def close(self):
+        await self.client.close_connection()
+
+    # ========= Market data =========
+    async def get_balance(self, asset: str) -> float:
+        info = await self.client.get_asset_balance(asset=asset)
+        if info:
+            return float(info.get('free', 0))
+        return 0.0
+
+    async def get_klines(self, symbol: str, interval="1m", limit=100):
+        return await self.client.get_klines(symbol=normalize_symbol(symbol), interval=interval, limit=limit)
+
+    async def get_ticker(self, symbol: str) -> Dict[str, Any]:
+        return await self.client.get_ticker(symbol=normalize_symbol(symbol))
+
+    async def get_all_prices(self) -> Dict[str, float]:
+        return {t['symbol']: float(t['price']) for t in await self.client.get_all_tickers()}
+
+    async def warm_filters(self, symbols: Optional[Sequence[str]] = None):
+        """Mesmo que BinanceClient.warm_filters (compartilha o arquivo em disco)."""
+        wanted = {normalize_symbol(s) for s in symbols} if symbols else None
+        if wanted is not None and wanted <= self._filters_cache.keys():
+            return
+        filters = _load_exchange_filters(self.testnet)
+        if filters is None:
+            try:
+                filters = _filters_from_exchange_info(await self.client.get_exchange_info())
+            except Exception as e:
+                logger.warning(f"Falha ao carregar exchangeInfo ({e}). Filtros serão buscados sob demanda.")
+                return
+            _save_exchange_filters(self.testnet, filters)
+        self._filters_cache.update(_select_filters(filters, wanted))
+
+    async def get_symbol_filters(self, symbol: str) -> SymbolFilters:
+        symbol = normalize_symbol(symbol)
+        if symbol not in self._filters_cache:
+            info = await self.client.get_symbol_info(symbol)
+            if not info:
+                raise RuntimeError(f"symbol info not found: {symbol}")
+            self._filters_cache[symbol] = _parse_filters(info)
+        return self._filters_cache[symbol]
@@ -1,11 +1,119 @@
+import functools
 import os
 import yaml
 from dotenv import load_dotenv
+from bot.utils import normalize_symbol
 
+# parser C (libyaml) quando disponível; senão o SafeLoader em Python puro
+_YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+CONFIG_PATH = "config.yaml"
+
+class ConfigError(ValueError):
+    """config.yaml inválido: detectado no start, não no meio do loop de trading."""
+
+_MODES = ("trade", "backtest", "simulate")
+_LOG_LEVELS = ("TRACE", "DEBUG", "INFO", "SUCCESS", "WARNING", "ERROR", "CRITICAL")
+# campos numéricos obrigatórios por seção -> tipo para coerção
+_STRATEGY_PARAMS = {
+    "ema_cross": {"fast_period": int, "slow_period": int},
+    "rsi": {"period": int, "overbought": float, "oversold": float},
+}
+_RISK_PARAMS = {
+    "capital_per_trade_pct": float, "stop_loss_pct": float, "take_profit_pct": float,
+    "max_daily_loss_pct": float, "max_trades_per_day": int,
+}
+_RISK_OPTIONAL = {"capital_base_usdt": float, "protective_orders_enabled": bool}
+
+def _coerce(section: dict, name: str, spec: dict, errors: list, required: bool = True):
+    for key, kind in spec.items():
+        if key not in section:
+            if required:
+                errors.append(f"{name}.{key}: obrigatório")
+            continue
+        try:
+            if kind is bool and not isinstance(section[key], bool):
+                raise ValueError
+            section[key] = kind(section[key])
+        except (TypeError, ValueError):
+            errors.append(f"{name}.{key}: esperado {kind.__name__}, veio {section[key]!r}")
+
+def _numeric(section, *keys) -> bool:
+    return isinstance(section, dict) and all(
+        isinstance(section.get(k), (int, float)) and not isinstance(section.get(k), bool) for k in keys
+    )
+
+def _validate(config: dict) -> None:
+    """
+    Valida e normaliza os tipos do config uma vez, no carregamento. Acumula
+    todos os problemas e levanta ConfigError com a lista completa.
+    """
+    errors = []
+    symbols = config.get("symbols")
+    if not isinstance(symbols, list) or not symbols or not all(isinstance(s, str) for s in symbols):
+        errors.append("symbols: lista não vazia de pares (ex.: BTCUSDT)")
+        symbols = []
+    if config.get("mode", "trade") not in _MODES:
+        errors.append(f"mode: um de {_MODES}, veio {config.get('mode')!r}")
+    if str(config.get("log_level", "INFO")).upper() not in _LOG_LEVELS:
+        errors.append(f"log_level: um de {_LOG_LEVELS}, veio {config.get('log_level')!r}")
+
+    strategies = config.setdefault("strategies", {})
+    if not isinstance(strategies, dict):
+        errors.append("strategies: mapa {par: [estratégias]}")
+        strategies = {}
+    else:
+        # chaves no mesmo formato que os runners usam ("BTC/USDT" -> BTCUSDT)
+        strategies = config["strategies"] = {normalize_symbol(str(k)): v for k, v in strategies.items()}
+    used = set()
+    for sym in symbols:
+        names = strategies.setdefault(normalize_symbol(sym), [])
+        if not isinstance(names, list):
+            errors.append(f"strategies.{sym}: lista de estratégias")
+            continue
+        used.update(names)
+    for name in sorted(used):
+        if name not in _STRATEGY_PARAMS:
+            errors.append(f"strategies: estratégia desconhecida {name!r}")
+        elif not isinstance(config.get(name), dict):
+            errors.append(f"{name}: seção de parâmetros ausente")
+        else:
+            _coerce(config[name], name, _STRATEGY_PARAMS[name], errors)
+    # ordem entre campos só quando ambos passaram na coerção (senão o erro de tipo já foi listado)
+    ema, rsi = config.get("ema_cross"), config.get("rsi")
+    if "ema_cross" in used and _numeric(ema, "fast_period", "slow_period") and ema["fast_period"] >= ema["slow_period"]:
+        errors.append("ema_cross: fast_period deve ser menor que slow_period")
+    if "rsi" in used and _numeric(rsi, "oversold", "overbought") and rsi["oversold"] >= rsi["overbought"]:
+        errors.append("rsi: oversold deve ser menor que overbought")
+
+    risk = config.get("risk")
+    if not isinstance(risk, dict):
+        errors.append("risk: seção obrigatória")
+    else:
+        _coerce(risk, "risk", _RISK_PARAMS, errors)
+        _coerce(risk, "risk", _RISK_OPTIONAL, errors, required=False)
+        unknown = set(risk) - set(_RISK_PARAMS) - set(_RISK_OPTIONAL)
+        if unknown:
+            errors.append(f"risk: chaves desconhecidas {sorted(unknown)}")
+
+    ia = config.setdefault("ia", {})
+    if isinstance(ia, dict) and ia.get("enabled"):
+        _coerce(ia, "ia", {"retrain_every": float}, errors)
+
+    if errors:
+        raise ConfigError("config.yaml inválido:\n  - " + "\n  - ".join(errors))
+
+@functools.lru_cache(maxsize=1)
 def load_config():
+    """
+    Lê config.yaml + .env uma única vez por processo e devolve sempre o mesmo
+    dict (alterações em runtime, ex. a IA ajustando o RSI, valem para todos).
+    Valida o schema na carga (ConfigError lista tudo o que estiver errado).
+    Para recarregar do disco: load_config.cache_clear().
+    """
     load_dotenv()
-    with open("config.yaml", "r") as f:
-        config = yaml.safe_load(f)
+    with open(CONFIG_PATH, "r") as f:
+        config = yaml.load(f, Loader=_YamlLoader)
+    _validate(config)
     testnet = config.get('testnet', False)
     # Escolhe as chaves e URLs corretas conforme o ambiente
     if testnet:
@@ -0,0 +1,42 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from bot.binance_client import BinanceClient
+from bot.config import load_config
+from bot.ia import IAManager
+from bot.market_data import MarketDataService
+from bot.notifier import Notifier
+from bot.risk import RiskManager
+from bot.strategies import StrategyManager
+
+@dataclass
+class AppContext:
+    """
+    Dependências do processo, montadas uma vez no entry point (main / ws_manager)
+    e injetadas nos componentes, em vez de cada um recriar a sua.
+    """
+    config: Dict[str, Any]
+    binance: Any  # BinanceClient (síncrono) ou AsyncBinanceClient
+    mds: MarketDataService
+    notifier: Notifier
+    risk: RiskManager
+    strategies: StrategyManager
+    ia_manager: Optional[IAManager] = None
+
+    @classmethod
+    def build(cls, binance, config: Optional[Dict[str, Any]] = None, maxlen: int = 2000) -> "AppContext":
+        config = load_config() if config is None else config
+        mds = MarketDataService(maxlen=maxlen)
+        ia_manager = None
+        if config.get('ia', {}).get('enabled'):
+            # a IA usa o cliente síncrono; com o assíncrono ela pega o singleton sob demanda
+            ia_manager = IAManager(config, client=binance if isinstance(binance, BinanceClient) else None)
+        return cls(
+            config=config,
+            binance=binance,
+            mds=mds,
+            notifier=Notifier(config),
+            risk=RiskManager(config['risk']),
+            strategies=StrategyManager(config, mds),
+            ia_manager=ia_manager,
+        )
@@ -1,9 +1,14 @@
+import math
 from typing import Optional, Dict, Any, Tuple
+import numpy as np
 from loguru import logger
-from bot.binance_client import BinanceClient
+from bot.binance_client import BinanceClient, get_binance_client
 from bot.risk import RiskManager
 from bot.utils import normalize_symbol
-from bot.state import append_trade
+from bot.state import append_trade, get_trade_cursor, save_trade_cursor
+
+# tolerância relativa entre saldo da carteira e qty reconstruída pelo cursor
+RECONCILE_QTY_RTOL = 1e-6
 
 class ExecutionService:
     """
@@ -14,8 +19,8 @@ class ExecutionService:
       - Proteções P0: SL/TP via OCO quando possível; fallback watchdog por preço
       - Reconciliação inicial de posição/PM
     """
-    def __init__(self, risk: RiskManager, notifier=None):
-        self.client = BinanceClient()
+    def __init__(self, risk: RiskManager, notifier=None, client: Optional[BinanceClient] = None):
+        self.client = client or get_binance_client()
         self.risk = risk
         self.notifier = notifier
 
@@ -24,6 +29,8 @@ class ExecutionService:
         self.last_buy_qty: Dict[str, float] = {}
         self.stop_price: Dict[str, float] = {}
         self.take_price: Dict[str, float] = {}
+        self._base_asset_cache: Dict[str, str] = {}
+        self.client.breaker.on_change = self._on_breaker_change
 
     # ---------- helpers ----------
     def _notify(self, text: str):
@@ -33,9 +40,18 @@ class ExecutionService:
             except Exception:
                 logger.warning("Falha ao notificar Telegram")
 
+    def _on_breaker_change(self, state: str):
+        if state == "open":
+            self._notify(f"🔌 API Binance instável: modo degradado, chamadas suspensas por {self.client.breaker.cooldown:.0f}s.")
+        elif state == "closed":
+            self._notify("✅ API Binance normalizada: operação retomada.")
+
     def _base_asset(self, symbol: str) -> str:
-        info = self.client.get_symbol_info(symbol)
-        return info["baseAsset"]
+        # o baseAsset de um par não muda: busca uma vez por símbolo
+        base = self._base_asset_cache.get(symbol)
+        if base is None:
+            base = self._base_asset_cache[symbol] = self.client.get_symbol_info(symbol)["baseAsset"]
+        return base
 
     def _last_price(self, symbol: str) -> float:
         return float(self.client.get_ticker(symbol)["lastPrice"])
@@ -43,36 +59,62 @@ class ExecutionService:
     # ---------- reconciliação ----------
     def reconcile_for_symbol(self, symbol: str) -> None:
         """
-        Recupera posição (qty) e PM aproximado a partir do saldo e trades recentes.
+        Recupera posição (qty) e PM a partir do saldo e do histórico de trades.
+        Guarda em state um cursor (último trade id + a qty/PM reconstruídos até
+        ele): nas próximas vezes busca só os trades novos (fromId) e atualiza o
+        PM incrementalmente. Se o saldo não bater com a qty do cursor (depósito,
+        saque), o cursor é descartado e o PM reconstruído do zero.
         """
         base = self._base_asset(symbol)
         wallet_qty = float(self.client.get_balance(base))
+        cursor = get_trade_cursor(symbol)
+
+        pm = None
+        if cursor:
+            qty, pm, last_id = float(cursor["qty"]), float(cursor["pm"]), int(cursor["id"])
+            for tr in self.client.get_my_trades_since(symbol, last_id):
+                q, p = float(tr["qty"]), float(tr["price"])
+                if tr.get("isBuyer", False):
+                    pm = (pm * qty + p * q) / (qty + q) if qty + q > 0 else p
+                    qty += q
+                else:
+                    qty = max(0.0, qty - q)  # venda não muda o PM do que sobrou
+                if tr.get("commissionAsset") == base:
+                    qty = max(0.0, qty - float(tr.get("commission", 0.0)))  # taxa paga no próprio ativo
+                last_id = max(last_id, int(tr["id"]))
+            if not math.isclose(qty, wallet_qty, rel_tol=RECONCILE_QTY_RTOL, abs_tol=1e-12):
+                logger.info(f"[{symbol}] Saldo {wallet_qty:.8f} != cursor {qty:.8f} (depósito/saque?): reconstruindo PM.")
+                pm = None
+
+        if pm is None:
+            # primeira vez (ou cursor inválido): média ponderada de BUYS recentes limitada ao saldo atual
+            trades = self.client.get_my_trades(symbol, limit=200)
+            rem = wallet_qty
+            cost = 0.0
+            for tr in reversed(trades):
+                if not tr.get("isBuyer", False):
+                    # vendeu; ignora na reconstrução de PM de carteira atual
+                    continue
+                take = min(rem, float(tr["qty"]))
+                cost += take * float(tr["price"])
+                rem -= take
+                if rem <= 0:
+                    break
+            pm = (cost / wallet_qty) if wallet_qty > 0 else 0.0
+            last_id = max((int(tr["id"]) for tr in trades), default=0)
+            qty = wallet_qty
+
         if wallet_qty <= 0:
-            self.last_buy_qty[symbol] = 0.0
-            self.last_buy_price[symbol] = 0.0
-            return
+            pm = 0.0
+        # cursor guarda a qty de onde o PM saiu; regrava sempre que algo mudou
+        new_cursor = {"id": int(last_id), "qty": float(qty), "pm": float(pm)}
+        if new_cursor != cursor:
+            save_trade_cursor(symbol, last_id, qty, pm)
 
-        # heurística: média ponderada de BUYS recentes limitada ao saldo atual
-        trades = self.client.get_my_trades(symbol, limit=200)
-        rem = wallet_qty
-        cost = 0.0
-        for tr in reversed(trades):
-            qty = float(tr["qty"])
-            price = float(tr["price"])
-            is_buy = bool(tr.get("isBuyer", False))
-            if not is_buy:
-                # vendeu; ignora na reconstrução de PM de carteira atual
-                continue
-            take = min(rem, qty)
-            cost += take * price
-            rem -= take
-            if rem <= 0:
-                break
-
-        pm = (cost / wallet_qty) if wallet_qty > 0 else 0.0
         self.last_buy_qty[symbol] = wallet_qty
         self.last_buy_price[symbol] = pm
-        logger.info(f"[{symbol}] Reconciliação: qty={wallet_qty:.6f}, pm={pm:.6f}")
+        if wallet_qty > 0:
+            logger.info(f"[{symbol}] Reconciliação: qty={wallet_qty:.6f}, pm={pm:.6f}")
 
     def reconcile_all(self, symbols):
         for s in symbols:
@@ -125,17 +167,19 @@ class ExecutionService:
 
         if try_sell:
             self._notify(f"🛑 [{symbol}] Proteção acionada ({reason}). Enviando SELL market…")
+            # aqui o preço precisa ser o mais fresco possível: busca via REST
             return self._execute_sell(symbol)
         return None
 
     # ---------- entrada ----------
-    def _execute_buy(self, symbol: str, desired_quote_usdt: float) -> Optional[Dict[str, Any]]:
+    def _execute_buy(self, symbol: str, desired_quote_usdt: float,
+                     last_price: Optional[float] = None) -> Optional[Dict[str, Any]]:
         flt = self.client.get_symbol_filters(symbol)
-        last_price = self._last_price(symbol)
+        last_price = float(last_price) if last_price else self._last_price(symbol)
 
-        if desired_quote_usdt < flt["minNotional"]:
+        if desired_quote_usdt < flt.minNotional:
             msg = (f"[{symbol}] Tamanho pedido ({desired_quote_usdt:.2f} USDT) "
-                   f"< MIN_NOTIONAL ({flt['minNotional']:.2f}).")
+                   f"< MIN_NOTIONAL ({flt.minNotional:.2f}).")
             logger.warning(msg); self._notify("⚠️ " + msg)
             return None
 
@@ -146,17 +190,19 @@ class ExecutionService:
             logger.warning(f"[{symbol}] quoteOrderQty falhou ({e}). Fallback por qty…")
             qty_raw = desired_quote_usdt / last_price
             qty_adj, _ = self.client.conform_qty_price(symbol, qty_raw, last_price)
-            if qty_adj * last_price < flt["minNotional"]:
+            if qty_adj * last_price < flt.minNotional:
                 msg = (f"[{symbol}] Mesmo no fallback, qty*preço ({qty_adj*last_price:.4f}) "
-                       f"< MIN_NOTIONAL ({flt['minNotional']:.4f}). Abortando BUY.")
+                       f"< MIN_NOTIONAL ({flt.minNotional:.4f}). Abortando BUY.")
                 logger.warning(msg); self._notify("⚠️ " + msg)
                 return None
-            order = self.client.create_market_order_qty(symbol, "buy", qty_adj)
+            order = self.client.create_market_order_qty(symbol, "buy", qty_adj, ref_price=last_price)
 
         # calcular média de execução
         fills = order.get("fills", [])
-        total_qty = sum(float(f["qty"]) for f in fills) if fills else 0.0
-        avg_price = (sum(float(f["price"]) * float(f["qty"]) for f in fills) / total_qty) if fills and total_qty>0 else last_price
+        qtys = np.fromiter((float(f["qty"]) for f in fills), dtype=np.float64, count=len(fills))
+        prices = np.fromiter((float(f["price"]) for f in fills), dtype=np.float64, count=len(fills))
+        total_qty = float(qtys.sum())
+        avg_price = float(prices @ qtys) / total_qty if total_qty > 0 else last_price
 
         self.last_buy_price[symbol] = avg_price
         self.last_buy_qty[symbol] = total_qty
@@ -170,9 +216,9 @@ class ExecutionService:
         return {"symbol": symbol, "side": "buy", "executed": True, "qty": total_qty, "avg_price": avg_price, "pnl": 0.0}
 
     # ---------- saída ----------
-    def _execute_sell(self, symbol: str) -> Optional[Dict[str, Any]]:
+    def _execute_sell(self, symbol: str, last_price: Optional[float] = None) -> Optional[Dict[str, Any]]:
         flt = self.client.get_symbol_filters(symbol)
-        last_price = self._last_price(symbol)
+        last_price = float(last_price) if last_price else self._last_price(symbol)
 
         target_qty = float(self.last_buy_qty.get(symbol, 0.0))
         base = self._base_asset(symbol)
@@ -185,23 +231,23 @@ class ExecutionService:
             return None
 
         qty_adj, _ = self.client.conform_qty_price(symbol, qty_raw, last_price)
-        if qty_adj < flt["minQty"]:
-            msg = f"[{symbol}] Qty ajustada {qty_adj} < minQty {flt['minQty']}. Abortando SELL."
+        if qty_adj < flt.minQty:
+            msg = f"[{symbol}] Qty ajustada {qty_adj} < minQty {flt.minQty}. Abortando SELL."
             logger.warning(msg); self._notify("⚠️ " + msg)
             return None
 
         notional = qty_adj * last_price
-        if notional < flt["minNotional"]:
-            needed_qty = flt["minNotional"] / last_price
+        if notional < flt.minNotional:
+            needed_qty = flt.minNotional / last_price
             qty_try, _ = self.client.conform_qty_price(symbol, min(wallet_qty, needed_qty), last_price)
-            if qty_try * last_price < flt["minNotional"]:
+            if qty_try * last_price < flt.minNotional:
                 msg = (f"[{symbol}] SELL abaixo do MIN_NOTIONAL "
-                       f"({qty_adj*last_price:.4f} < {flt['minNotional']:.4f}). Abortando.")
+                       f"({qty_adj*last_price:.4f} < {flt.minNotional:.4f}). Abortando.")
                 logger.warning(msg); self._notify("⚠️ " + msg)
                 return None
             qty_adj = qty_try
 
-        order = self.client.create_market_order_qty(symbol, "sell", qty_adj)
+        order = self.client.create_market_order_qty(symbol, "sell", qty_adj, ref_price=last_price)
 
         avg_buy = float(self.last_buy_price.get(symbol, last_price))
         pnl = (last_price - avg_buy) * qty_adj
@@ -218,7 +264,12 @@ class ExecutionService:
         return {"symbol": symbol, "side": "sell", "executed": True, "qty": qty_adj, "avg_price": last_price, "pnl": pnl}
 
     # ---------- API externa ----------
-    def place_signal(self, symbol: str, signal: str, usdt_balance: float) -> Optional[Dict[str, Any]]:
+    def place_signal(self, symbol: str, signal: str, usdt_balance: float,
+                     last_price: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        last_price: preço já conhecido pelo chamador (close do candle, get_all_prices);
+        sem ele, busca o ticker via REST.
+        """
         symbol = normalize_symbol(symbol)
         if signal not in ("buy", "sell"):
             return None
@@ -232,9 +283,9 @@ class ExecutionService:
                 quote_size = self.risk.position_size_from_balance(usdt_balance)
                 if quote_size <= 0:
                     logger.warning(f"[{symbol}] Sem USDT livre para BUY."); return None
-                return self._execute_buy(symbol, quote_size)
+                return self._execute_buy(symbol, quote_size, last_price)
             else:
-                return self._execute_sell(symbol)
+                return self._execute_sell(symbol, last_price)
         except Exception as e:
             logger.exception(f"[{symbol}] Falha ao executar {signal}: {e}")
             self._notify(f"❌ [{symbol}] Falha ao executar {signal}: {e}")
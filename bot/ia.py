@@ -1,53 +1,107 @@
+import datetime
+import hashlib
+import json
+import os
+from typing import Dict, Optional, Tuple
+
 import pandas as pd
 import numpy as np
 from loguru import logger
-from bot.binance_client import BinanceClient
+from numba import njit
+from bot.binance_client import BinanceClient, get_binance_client
+from bot.indicators import rsi_batch
+
+IA_CACHE_PATH = os.getenv("BOT_IA_CACHE_PATH", "data/ia_cache.json")
+IA_CACHE_MAX = 512  # entradas (symbol|hash dos closes) mantidas em disco
 
 class IAManager:
-    def __init__(self, config):
+    def __init__(self, config, client: Optional[BinanceClient] = None):
         self.config = config
-        self.last_retrain = None
+        self._client = client  # None => singleton do processo, criado só no primeiro retrain
+        # por símbolo: o retrain de um par não adia o dos outros
+        self.last_retrain: Dict[str, datetime.datetime] = {}
+        self._cache: Dict[str, Tuple[int, int]] = self._load_cache()
+
+    # ---------- cache de resultados ----------
+    def _load_cache(self) -> Dict[str, Tuple[int, int]]:
+        try:
+            with open(IA_CACHE_PATH, "r") as f:
+                return {k: tuple(v) for k, v in json.load(f).items()}
+        except (OSError, ValueError):
+            return {}
+
+    def _save_cache(self):
+        while len(self._cache) > IA_CACHE_MAX:
+            self._cache.pop(next(iter(self._cache)))
+        try:
+            os.makedirs(os.path.dirname(IA_CACHE_PATH) or ".", exist_ok=True)
+            tmp = IA_CACHE_PATH + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self._cache, f)
+            os.replace(tmp, IA_CACHE_PATH)
+        except OSError as e:
+            logger.warning(f"[IA] Não foi possível gravar cache {IA_CACHE_PATH}: {e}")
 
     def check_and_update_params(self, symbol, strategies_manager):
-        import datetime
         now = datetime.datetime.now()
-        if self.last_retrain and (now - self.last_retrain).days < self.config['ia']['retrain_every']:
+        last = self.last_retrain.get(symbol)
+        if last and (now - last).days < self.config['ia']['retrain_every']:
             return
-        self.last_retrain = now
+        self.last_retrain[symbol] = now
 
-        logger.info(f"[IA] Otimizando parâmetros RSI para {symbol}...")
-        client = BinanceClient()
+        client = self._client or get_binance_client()
         kl = client.get_klines(symbol, interval="1m", limit=500)
-        import pandas as pd
         df = pd.DataFrame(kl, columns=['t','o','h','l','c','v','T','q','n','tb','tq','ig'])
         df['c'] = df['c'].astype(float)
-        closes = df['c']
-
-        best_profit = -np.inf
-        best_overbought = None
-        best_oversold = None
-        for overbought in range(60, 85, 5):
-            for oversold in range(15, 40, 5):
-                profit = self._simulate_rsi(closes, 14, overbought, oversold)
-                if profit > best_profit:
-                    best_profit = profit
-                    best_overbought = overbought
-                    best_oversold = oversold
-
-        logger.info(f"[IA] Novo RSI {symbol}: overbought={best_overbought}, oversold={best_oversold}")
+        closes = df['c'].to_numpy()
+
+        # mesmos candles => mesmo resultado: pula a otimização (vale entre restarts)
+        key = f"{symbol}|{hashlib.blake2b(closes.tobytes(), digest_size=16).hexdigest()}"
+        if key in self._cache:
+            best_overbought, best_oversold = self._cache[key]
+            logger.info(f"[IA] RSI {symbol} do cache: overbought={best_overbought}, oversold={best_oversold}")
+        else:
+            logger.info(f"[IA] Otimizando parâmetros RSI para {symbol}...")
+            best_overbought, best_oversold = self._best_rsi_params(closes)
+            self._cache[key] = (best_overbought, best_oversold)
+            self._save_cache()
+            logger.info(f"[IA] Novo RSI {symbol}: overbought={best_overbought}, oversold={best_oversold}")
+
         self.config['rsi']['overbought'] = best_overbought
         self.config['rsi']['oversold'] = best_oversold
 
-    def _simulate_rsi(self, closes, period, overbought, oversold):
-        import ta
-        rsi = ta.momentum.rsi(pd.Series(closes), period)
-        in_trade = False
-        balance = 100
-        for i in range(period+1, len(rsi)):
-            if not in_trade and rsi[i] < oversold:
-                buy_price = closes.iloc[i]
+    def _best_rsi_params(self, closes: np.ndarray) -> Tuple[int, int]:
+        # RSI é o mesmo para todo o grid: calcula uma vez e varre só os limiares
+        rsi = rsi_batch(closes, 14)
+        overbought_arr = np.arange(60, 85, 5, dtype=np.float64)
+        oversold_arr = np.arange(15, 40, 5, dtype=np.float64)
+        profits = _rsi_grid_profits(closes, rsi, 14 + 1, overbought_arr, oversold_arr)
+        i, j = np.unravel_index(np.argmax(profits), profits.shape)
+        return int(overbought_arr[i]), int(oversold_arr[j])
+
+# ----- kernels compilados (numba) -----
+@njit(cache=True)
+def _simulate_rsi_kernel(closes, rsi, start, overbought, oversold):
+    # compra quando RSI < oversold, vende no primeiro RSI > overbought seguinte
+    # varredura única de eventos sobre arrays (NaN nunca dispara: comparações dão False)
+    in_trade = False
+    balance = 100.0
+    buy_price = 0.0
+    for i in range(start, len(rsi)):
+        r = rsi[i]
+        if not in_trade:
+            if r < oversold:
+                buy_price = closes[i]
                 in_trade = True
-            elif in_trade and rsi[i] > overbought:
-                balance *= closes.iloc[i] / buy_price
-                in_trade = False
-        return balance - 100
+        elif r > overbought:
+            balance *= closes[i] / buy_price
+            in_trade = False
+    return balance - 100.0
+
+@njit(cache=True)
+def _rsi_grid_profits(closes, rsi, start, overbought_arr, oversold_arr):
+    out = np.empty((len(overbought_arr), len(oversold_arr)))
+    for i in range(len(overbought_arr)):
+        for j in range(len(oversold_arr)):
+            out[i, j] = _simulate_rsi_kernel(closes, rsi, start, overbought_arr[i], oversold_arr[j])
+    return out
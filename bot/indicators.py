@@ -0,0 +1,68 @@
+"""
+Indicadores compilados (numba) com as mesmas fórmulas do `ta`:
+EMA = ewm(span=n, adjust=False) e RSI de Wilder = ewm(alpha=1/n, adjust=False)
+sobre ganhos/perdas. Versões *_update avançam o estado em O(1) por candle;
+versões *_batch devolvem a série inteira (NaN no aquecimento, como o `ta`).
+"""
+import numpy as np
+from numba import njit
+
+def ema_alpha(period: int) -> float:
+    return 2.0 / (period + 1.0)
+
+@njit(cache=True)
+def ema_update(prev, x, alpha):
+    return (1.0 - alpha) * prev + alpha * x
+
+@njit(cache=True)
+def ema_batch(closes, period):
+    n = len(closes)
+    out = np.full(n, np.nan)
+    if n == 0:
+        return out
+    alpha = 2.0 / (period + 1.0)
+    e = closes[0]
+    for i in range(n):
+        if i > 0:
+            e = ema_update(e, closes[i], alpha)
+        if i >= period - 1:
+            out[i] = e
+    return out
+
+@njit(cache=True)
+def rsi_value(avg_gain, avg_loss):
+    if avg_loss == 0.0:
+        return 100.0
+    return 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+
+@njit(cache=True)
+def rsi_update(avg_gain, avg_loss, prev_close, x, n):
+    """Avança as médias de Wilder com o close x; devolve (avg_gain, avg_loss, rsi)."""
+    d = x - prev_close
+    alpha = 1.0 / n
+    avg_gain = (1.0 - alpha) * avg_gain + alpha * (d if d > 0.0 else 0.0)
+    avg_loss = (1.0 - alpha) * avg_loss + alpha * (-d if d < 0.0 else 0.0)
+    return avg_gain, avg_loss, rsi_value(avg_gain, avg_loss)
+
+@njit(cache=True)
+def rsi_state(closes, period):
+    """Médias de Wilder (avg_gain, avg_loss) após consumir todos os closes."""
+    # o `ta` semeia as médias com 0 no primeiro candle (diff NaN vira 0)
+    g = 0.0
+    l = 0.0
+    for i in range(1, len(closes)):
+        g, l, _ = rsi_update(g, l, closes[i - 1], closes[i], period)
+    return g, l
+
+@njit(cache=True)
+def rsi_batch(closes, period):
+    n = len(closes)
+    out = np.full(n, np.nan)
+    g = 0.0
+    l = 0.0
+    for i in range(n):
+        if i > 0:
+            g, l, _ = rsi_update(g, l, closes[i - 1], closes[i], period)
+        if i >= period - 1:
+            out[i] = rsi_value(g, l)
+    return out
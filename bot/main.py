@@ -1,56 +1,158 @@
+import asyncio
+import os
 import time
+from typing import Dict
+from bot.streams import BinanceSocketManager
 from loguru import logger
 
 from bot.config import load_config
-from bot.binance_client import BinanceClient
-from bot.strategies import StrategyManager
-from bot.risk import RiskManager
-from bot.notifier import Notifier
-from bot.ia import IAManager
-from bot.market_data import MarketDataService
-
-def main():
+from bot.binance_client import AsyncBinanceClient
+from bot.context import AppContext
+from bot.utils import normalize_symbol, interval_seconds, next_boundary_delay
+
+try:
+    import uvloop  # loop em C (libuv); opcional, não existe no Windows
+except ImportError:
+    uvloop = None
+
+# máx. de símbolos com chamadas REST em voo ao mesmo tempo (peso de requisição da Binance)
+CONCURRENCY_LIMIT = int(os.getenv("BOT_CONCURRENCY_LIMIT", "5"))
+# WS sem nenhuma mensagem por esse tempo => roda um ciclo via REST até reconectar
+WS_FALLBACK_SEC = 60
+# o ciclo REST de fallback roda alinhado ao fechamento do candle, com essa folga
+CANDLE_CLOSE_GRACE_SEC = 2.0
+# klines buscados por símbolo em cada ciclo de fallback (cobre alguns candles perdidos)
+REST_FALLBACK_KLINES = 5
+
+async def main():
     config = load_config()
-    logger.add("trade.log", rotation="10 MB", level=config['log_level'])
+    # enqueue: escrita no arquivo numa thread do loguru, fora do event loop
+    logger.add("trade.log", rotation="10 MB", level=config['log_level'], enqueue=True)
 
-    binance = BinanceClient()
-    notifier = Notifier()
-    risk = RiskManager(config['risk'])
-    mds = MarketDataService(maxlen=2000)
-    strategies = StrategyManager(config, mds)
-    ia_manager = IAManager(config) if config.get('ia', {}).get('enabled') else None
+    binance = await AsyncBinanceClient.create()
+    await binance.warm_filters(config['symbols'])
+    ctx = AppContext.build(binance, config)
+    notifier, risk, mds, strategies, ia_manager = ctx.notifier, ctx.risk, ctx.mds, ctx.strategies, ctx.ia_manager
+    sem = asyncio.Semaphore(CONCURRENCY_LIMIT)
+    symbols = [normalize_symbol(s) for s in config['symbols']]
+    interval = strategies.interval
 
-    # Bootstrap do cache via REST para cada símbolo
-    for symbol in config['symbols']:
-        mds.bootstrap_from_rest(binance.client, symbol, "1m", limit=200)
+    # alimentados pelo WS: último preço (miniTicker) e fila de candles fechados
+    latest_price: Dict[str, float] = {}
+    closed: asyncio.Queue = asyncio.Queue()
+    last_msg = {"ts": time.monotonic()}
 
-    logger.info("Bot iniciado no modo: {}", config['mode'])
-    notifier.send(f"🚀 Bot iniciado no modo: {config['mode']}")
+    async def bootstrap(symbol):
+        async with sem:
+            klines = await binance.get_klines(symbol, interval=interval, limit=200)
+        mds.load_rest_klines(symbol, interval, klines)
 
-    while True:
-        for symbol in config['symbols']:
+    async def stream_market_data():
+        """Um único WS multiplexado: !miniTicker@arr (preços) + <symbol>@kline_<tf> (candles)."""
+        bsm = BinanceSocketManager(binance.client)
+        streams = ["!miniTicker@arr"] + [f"{s.lower()}@kline_{interval}" for s in symbols]
+        wanted = set(symbols)
+        backoff = 1
+        while True:
             try:
-                if ia_manager:
-                    ia_manager.check_and_update_params(symbol, strategies)
-
-                strats = config['strategies'][symbol]
-                for strat_name in strats:
-                    strategy = strategies.get_strategy(strat_name, symbol)
-                    signal = strategy.generate_signal()
-                    logger.info(f"[{symbol}] Estratégia {strat_name} => Sinal: {signal}")
-
-                    if config['mode'] != "trade":
-                        continue
-
-                    if signal in ["buy", "sell"]:
-                        qty_usdt = risk.position_size_from_balance(binance.get_balance('USDT'))
-                        # Para manter consistência com a execução centralizada, favor rodar ws_manager.py
-                        logger.info(f"[{symbol}] Sinal {signal} (modo polling). Tamanho alvo ~ {qty_usdt:.2f} USDT")
+                async with bsm.multiplex_socket(streams) as stream:
+                    logger.info(f"▶️  Streams ativos: {streams}")
+                    while True:
+                        msg = await stream.recv()
+                        if msg.get('e') == 'error':
+                            raise ConnectionError(msg.get('m'))
+                        last_msg["ts"] = time.monotonic()
+                        data = msg.get('data', msg)
+                        if isinstance(data, list):
+                            for t in data:
+                                if t['s'] in wanted:
+                                    latest_price[t['s']] = float(t['c'])
+                        elif data.get('e') == 'kline' and data['k']['x']:
+                            k = data['k']
+                            symbol = normalize_symbol(k['s'])
+                            mds.on_kline_closed(symbol, interval, k)
+                            latest_price[symbol] = float(k['c'])
+                            closed.put_nowait(symbol)
+                        backoff = 1
             except Exception as e:
-                logger.exception(f"Erro no loop principal para {symbol}: {e}")
-                notifier.send(f"❌ Erro ao operar {symbol}: {e}")
+                logger.error(f"WS caiu: {e}. Reconnect em {backoff}s...")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+
+    async def handle_symbol(symbol, price):
+        try:
+            if ia_manager:
+                await asyncio.to_thread(ia_manager.check_and_update_params, symbol, strategies)
+
+            strats = config['strategies'].get(symbol, [])
+            for strat_name in strats:
+                signal = strategies.signal(strat_name, symbol)
+                logger.info("[{}] Estratégia {} => Sinal: {}", symbol, strat_name, signal)
+
+                if config['mode'] != "trade":
+                    continue
 
-        time.sleep(60)
+                if signal in ["buy", "sell"]:
+                    async with sem:
+                        usdt = await binance.get_balance('USDT')
+                    qty_usdt = risk.position_size_from_balance(usdt)
+                    # Para manter consistência com a execução centralizada, favor rodar ws_manager.py
+                    logger.info("[{}] Sinal {} @ {}. Tamanho alvo ~ {:.2f} USDT", symbol, signal, price, qty_usdt)
+        except Exception as e:
+            logger.exception(f"Erro no loop principal para {symbol}: {e}")
+            notifier.send(f"❌ Erro ao operar {symbol}: {e}")
+
+    async def refresh_symbol(symbol):
+        # só reavalia se entrou candle fechado novo desde o último (WS ou REST)
+        async with sem:
+            klines = await binance.get_klines(symbol, interval=interval, limit=REST_FALLBACK_KLINES)
+        if mds.append_closed_klines(symbol, interval, klines, int(time.time() * 1000)):
+            await handle_symbol(symbol, latest_price.get(symbol) or mds.last_close(symbol, interval))
+
+    async def rest_cycle():
+        # um único /ticker/price para todos os símbolos em vez de um ticker por par
+        async with sem:
+            prices = await binance.get_all_prices()
+        latest_price.update((s, prices[s]) for s in symbols if s in prices)
+        await asyncio.gather(*(refresh_symbol(symbol) for symbol in symbols))
+
+    ws_task = None
+    running = set()
+    try:
+        # Bootstrap do cache via REST, todos os símbolos em paralelo
+        await asyncio.gather(*(bootstrap(symbol) for symbol in symbols))
+
+        logger.info("Bot iniciado no modo: {}", config['mode'])
+        notifier.send(f"🚀 Bot iniciado no modo: {config['mode']}")
+
+        # orientado a eventos: estratégias rodam no candle fechado do próprio símbolo
+        ws_task = asyncio.create_task(stream_market_data())
+        period = interval_seconds(interval)
+        while True:
+            # timeout recalculado do relógio a cada volta: acorda sempre em fechamento + folga
+            timeout = next_boundary_delay(period, CANDLE_CLOSE_GRACE_SEC)
+            try:
+                symbol = await asyncio.wait_for(closed.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                if time.monotonic() - last_msg["ts"] < WS_FALLBACK_SEC:
+                    continue  # WS vivo, só não fechou candle ainda
+                logger.warning(f"⚠️  WS sem mensagens há {WS_FALLBACK_SEC}s. Ciclo via REST…")
+                cycle_start = time.monotonic()
+                await rest_cycle()
+                elapsed = time.monotonic() - cycle_start
+                if elapsed > period:
+                    logger.warning(f"⏱️  Ciclo REST levou {elapsed:.1f}s (> {period}s): candles perdidos.")
+                continue
+            price = latest_price.get(symbol) or mds.last_close(symbol, interval)
+            task = asyncio.create_task(handle_symbol(symbol, price))
+            running.add(task)
+            task.add_done_callback(running.discard)
+    finally:
+        if ws_task:
+            ws_task.cancel()
+        await binance.close()
 
 if __name__ == "__main__":
-    main()
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    asyncio.run(main())
@@ -1,58 +1,295 @@
-from collections import deque
-from typing import Dict, Deque
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+import numpy as np
 import pandas as pd
-from bot.utils import normalize_symbol
+from bot.utils import normalize_symbol, stat_cached
+
+# colunas do buffer (SoA): nome -> dtype
+_FIELDS: Tuple[Tuple[str, type], ...] = (
+    ("open_time", np.int64),
+    ("open", np.float64),
+    ("high", np.float64),
+    ("low", np.float64),
+    ("close", np.float64),
+    ("volume", np.float64),
+    ("close_time", np.int64),
+)
+_NAMES = tuple(name for name, _ in _FIELDS)
+
+# cabeçalho (int64, só no modo memória compartilhada): seq do seqlock, idx, count
+_HEADER = 3
+_SEQ, _IDX, _COUNT = 0, 1, 2
+
+class _Ring:
+    """
+    Buffer circular de candles de um (símbolo, timeframe): uma coluna NumPy
+    pré-alocada por campo + índice de escrita. Nada de dict por candle.
+    Com path, as colunas ficam num arquivo mapeado (np.memmap) legível por
+    outros processos. Um único escritor por arquivo; cada update é cercado
+    por um seqlock (seq ímpar = escrita em curso) e o leitor refaz a cópia
+    se seq mudou no meio, então nunca vê um wrap pela metade.
+    """
+    __slots__ = ("cols", "idx", "count", "maxlen", "hdr", "readonly", "ino")
+
+    def __init__(self, maxlen: int, path: Optional[str] = None, readonly: bool = False):
+        self.idx = 0
+        self.count = 0
+        self.hdr = None
+        self.readonly = readonly
+        self.ino = None
+        if path is None:
+            self.maxlen = maxlen
+            self.cols = {name: np.empty(maxlen, dtype=dt) for name, dt in _FIELDS}
+            return
+        if readonly:
+            # maxlen vem do tamanho do arquivo (todos os campos têm 8 bytes)
+            maxlen = (os.path.getsize(path) // 8 - _HEADER) // len(_FIELDS)
+            mode = "r"
+        else:
+            size = 8 * (_HEADER + maxlen * len(_FIELDS))
+            if not os.path.exists(path) or os.path.getsize(path) != size:
+                # arquivo novo via tmp + rename: quem já mapeou o antigo segue no inode velho
+                tmp = path + ".tmp"
+                with open(tmp, "wb") as f:
+                    f.truncate(size)
+                os.replace(tmp, path)
+            mode = "r+"
+        self.ino = os.stat(path).st_ino
+        self.maxlen = maxlen
+        self.hdr = np.memmap(path, dtype=np.int64, mode=mode, shape=(_HEADER,))
+        self.cols = {
+            name: np.memmap(path, dtype=dt, mode=mode, offset=8 * (_HEADER + i * maxlen), shape=(maxlen,))
+            for i, (name, dt) in enumerate(_FIELDS)
+        }
+        if not readonly:
+            # arquivo reaproveitado (sem truncar): leitores anexados veem buffer vazio, não lixo
+            self._begin()
+            self._publish()
+
+    def _begin(self) -> None:
+        if self.hdr is not None:
+            self.hdr[_SEQ] += 1  # ímpar: escrita em curso
+
+    def _publish(self) -> None:
+        # cabeçalho por último: leitor nunca vê count à frente dos dados
+        if self.hdr is not None:
+            self.hdr[_IDX] = self.idx
+            self.hdr[_COUNT] = self.count
+            self.hdr[_SEQ] += 1  # par de novo: update completo
+
+    def read(self, fn):
+        """
+        fn(self) com idx/count coerentes. No leitor de memória compartilhada,
+        fn deve copiar o que devolve: se o escritor mexeu no meio, refaz.
+        """
+        if not self.readonly:
+            return fn(self)
+        while True:
+            seq = int(self.hdr[_SEQ])
+            if seq & 1:
+                time.sleep(0)  # escritor no meio de um update
+                continue
+            self.idx, self.count = int(self.hdr[_IDX]), int(self.hdr[_COUNT])
+            out = fn(self)
+            if int(self.hdr[_SEQ]) == seq:
+                return out
+
+    def append(self, values) -> None:
+        self._begin()
+        i = self.idx
+        for name, v in zip(_NAMES, values):
+            self.cols[name][i] = v
+        self.idx = (i + 1) % self.maxlen
+        self.count = min(self.count + 1, self.maxlen)
+        self._publish()
+
+    def extend(self, columns) -> None:
+        n = len(columns[0])
+        if n == 0:
+            return
+        self._begin()
+        if n >= self.maxlen:
+            # só os últimos maxlen sobrevivem: escreve direto, buffer fica "reto"
+            for name, col in zip(_NAMES, columns):
+                self.cols[name][:] = col[n - self.maxlen:]
+            self.idx, self.count = 0, self.maxlen
+            self._publish()
+            return
+        pos = (self.idx + np.arange(n)) % self.maxlen
+        for name, col in zip(_NAMES, columns):
+            self.cols[name][pos] = col
+        self.idx = (self.idx + n) % self.maxlen
+        self.count = min(self.count + n, self.maxlen)
+        self._publish()
+
+    def last(self, name: str):
+        return self.cols[name][(self.idx - 1) % self.maxlen]
+
+    def last_n(self, name: str, n: int) -> np.ndarray:
+        n = min(n, self.count)
+        col = self.cols[name]
+        start = self.idx - n
+        if start >= 0:
+            out = col[start:self.idx]
+        else:
+            out = np.concatenate((col[start:], col[:self.idx]))
+        return np.array(out) if self.readonly else out
+
+    def view(self) -> Dict[str, np.ndarray]:
+        if self.count < self.maxlen:
+            # ainda não deu a volta: dados em [0, count), fatia sem cópia
+            out = {name: col[:self.count] for name, col in self.cols.items()}
+        elif self.idx == 0:
+            out = dict(self.cols)
+        else:
+            i = self.idx
+            out = {name: np.concatenate((col[i:], col[:i])) for name, col in self.cols.items()}
+        if self.readonly:
+            # leitor: cópia estável (validada pelo seqlock em read())
+            out = {name: np.array(col) for name, col in out.items()}
+        return out
 
 class MarketDataService:
     """
     Mantém buffers de candles por símbolo/timeframe alimentados pelo WS.
     Evita chamadas REST repetidas para estratégias.
+    Com shm_dir (ex.: /dev/shm), os buffers vão para arquivos mapeados em
+    memória; outro processo com readonly=True no mesmo diretório lê os
+    mesmos candles sem cópia nem pickle.
     """
-    def __init__(self, maxlen: int = 1000):
+    def __init__(self, maxlen: int = 1000, shm_dir: Optional[str] = None, readonly: bool = False):
         self.maxlen = maxlen
-        self.buffers: Dict[str, Deque[dict]] = {}  # chave: "SYMBOL|1m"
+        self.shm_dir = shm_dir
+        self.readonly = readonly
+        if shm_dir and not readonly:
+            os.makedirs(shm_dir, exist_ok=True)
+        self.buffers: Dict[str, _Ring] = {}  # chave: "SYMBOL|1m"
+        # criação de buffers pode vir de várias threads (bootstrap em paralelo)
+        self._lock = threading.Lock()
 
     def _key(self, symbol: str, interval: str) -> str:
         return f"{normalize_symbol(symbol)}|{interval}"
 
+    def _shm_path(self, k: str) -> str:
+        return os.path.join(self.shm_dir, "mds_{}.bin".format(k.replace("|", "_")))
+
+    def _ring(self, symbol: str, interval: str) -> _Ring:
+        k = self._key(symbol, interval)
+        ring = self.buffers.get(k)
+        if ring is None:
+            if self.readonly:
+                raise RuntimeError("MarketDataService somente leitura")
+            with self._lock:
+                ring = self.buffers.get(k)
+                if ring is None:
+                    path = self._shm_path(k) if self.shm_dir else None
+                    ring = self.buffers[k] = _Ring(self.maxlen, path)
+        return ring
+
+    def _find(self, symbol: str, interval: str) -> Optional[_Ring]:
+        """Buffer existente ou None; no modo leitor, anexa ao arquivo do escritor se já existir."""
+        k = self._key(symbol, interval)
+        ring = self.buffers.get(k)
+        if not (self.readonly and self.shm_dir):
+            return ring
+        st = stat_cached(self._shm_path(k))
+        if st is None:
+            return ring
+        if ring is None or ring.ino != st.st_ino:
+            # primeira leitura, ou o escritor recriou o arquivo (outro tamanho): (re)anexa
+            with self._lock:
+                ring = self.buffers.get(k)
+                if ring is None or ring.ino != st.st_ino:
+                    ring = self.buffers[k] = _Ring(0, self._shm_path(k), readonly=True)
+        return ring
+
     def bootstrap_from_rest(self, client, symbol: str, interval: str = "1m", limit: int = 200):
         k = self._key(symbol, interval)
         if k in self.buffers:
             return
-        klines = client.get_klines(symbol=symbol, interval=interval, limit=limit)
-        buf: Deque[dict] = deque(maxlen=self.maxlen)
-        for row in klines:
-            buf.append({
-                "open_time": int(row[0]),
-                "open": float(row[1]),
-                "high": float(row[2]),
-                "low": float(row[3]),
-                "close": float(row[4]),
-                "volume": float(row[5]),
-                "close_time": int(row[6]),
-                "closed": True,
-            })
-        self.buffers[k] = buf
+        self.load_rest_klines(symbol, interval, client.get_klines(symbol=symbol, interval=interval, limit=limit))
+
+    def load_rest_klines(self, symbol: str, interval: str, klines):
+        """Carrega klines no formato REST (listas) já baixados, ex.: via cliente assíncrono."""
+        self._ring(symbol, interval)
+        if not klines:
+            return
+        cols = list(zip(*klines))
+        self.bulk_load(symbol, interval, cols[0], cols[1], cols[2], cols[3], cols[4], cols[5], cols[6])
+
+    def append_closed_klines(self, symbol: str, interval: str, klines, now_ms: int) -> int:
+        """
+        Acrescenta klines REST já fechados (close_time < now_ms) e mais novos que
+        o último do buffer; devolve quantos entraram (0 => candle não avançou).
+        """
+        ot = self.get_arrays(symbol, interval)["open_time"]
+        last = int(ot[-1]) if len(ot) else -1
+        new = [k for k in klines if int(k[0]) > last and int(k[6]) < now_ms]
+        if new:
+            self.load_rest_klines(symbol, interval, new)
+        return len(new)
 
     def on_kline_closed(self, symbol: str, interval: str, k: dict):
-        kname = self._key(symbol, interval)
-        if kname not in self.buffers:
-            self.buffers[kname] = deque(maxlen=self.maxlen)
-        self.buffers[kname].append({
-            "open_time": int(k["t"]),
-            "open": float(k["o"]),
-            "high": float(k["h"]),
-            "low": float(k["l"]),
-            "close": float(k["c"]),
-            "volume": float(k["v"]),
-            "close_time": int(k["T"]),
-            "closed": True,
-        })
+        # k no formato de kline do WS da Binance (OHLCV em string)
+        self.on_candle_closed(symbol, interval, k["t"], k["o"], k["h"], k["l"], k["c"], k["v"], k["T"])
+
+    def on_candle_closed(self, symbol: str, interval: str, open_time, o, h, l, c, v, close_time):
+        """
+        Mesmo que on_kline_closed, mas recebe os campos já separados
+        (ex.: colunas NumPy do backtest), sem montar um dict de kline.
+        """
+        self._ring(symbol, interval).append((
+            int(open_time), float(o), float(h), float(l), float(c), float(v), int(close_time)
+        ))
+
+    def bulk_load(self, symbol: str, interval: str, open_time, o, h, l, c, v, close_time):
+        """
+        Insere vários candles fechados de uma vez. Recebe colunas alinhadas
+        (arrays NumPy ou sequências) e grava cada uma no buffer numa única
+        operação vetorizada.
+        """
+        self._ring(symbol, interval).extend([
+            np.asarray(open_time, dtype=np.int64),
+            *(np.asarray(x, dtype=np.float64) for x in (o, h, l, c, v)),
+            np.asarray(close_time, dtype=np.int64),
+        ])
+
+    def get_arrays(self, symbol: str, interval: str = "1m") -> Dict[str, np.ndarray]:
+        """
+        Colunas em ordem cronológica (open_time, open, high, low, close, volume,
+        close_time). Sem cópia enquanto o buffer não deu a volta, então trate
+        como somente leitura e válido até o próximo candle (no modo leitor é
+        sempre uma cópia).
+        """
+        ring = self._find(symbol, interval)
+        if ring is None:
+            return {name: np.empty(0, dtype=dt) for name, dt in _FIELDS}
+        return ring.read(_Ring.view)
+
+    def last_close(self, symbol: str, interval: str = "1m") -> Optional[float]:
+        """Close do último candle fechado (leitura O(1) do buffer); None se ainda vazio."""
+        ring = self._find(symbol, interval)
+        if ring is None:
+            return None
+        return ring.read(lambda r: float(r.last("close")) if r.count else None)
+
+    def last_close_time(self, symbol: str, interval: str = "1m") -> Optional[int]:
+        ring = self._find(symbol, interval)
+        if ring is None:
+            return None
+        return ring.read(lambda r: int(r.last("close_time")) if r.count else None)
+
+    def last_n_closes(self, symbol: str, interval: str = "1m", n: int = 2) -> np.ndarray:
+        """Últimos n closes em ordem cronológica (menos, se o buffer tiver menos)."""
+        ring = self._find(symbol, interval)
+        if ring is None:
+            return np.empty(0, dtype=np.float64)
+        return ring.read(lambda r: r.last_n("close", n))
 
     def get_df(self, symbol: str, interval: str = "1m") -> pd.DataFrame:
-        k = self._key(symbol, interval)
-        buf = self.buffers.get(k, None)
-        if not buf or len(buf) < 2:
+        arrays = self.get_arrays(symbol, interval)
+        if len(arrays["close"]) < 2:
             return pd.DataFrame()
-        df = pd.DataFrame(list(buf))
-        return df
+        return pd.DataFrame(arrays, copy=False)
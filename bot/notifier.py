@@ -1,19 +1,90 @@
+import asyncio
+import atexit
+import queue
+import threading
 from loguru import logger
 from telegram import Bot
 from bot.config import load_config
 
+NOTIFY_QUEUE_MAX = 1000
+# mensagens acumuladas viram um único envio (limite do Telegram: 4096 chars)
+NOTIFY_BATCH_MAX = 20
+TELEGRAM_MAX_CHARS = 4096
+_STOP = object()
+
 class Notifier:
-    def __init__(self):
-        config = load_config()
+    """
+    Envia mensagens ao Telegram numa thread própria: send() só enfileira e
+    volta na hora, sem round-trip HTTPS no loop de trading.
+    """
+    def __init__(self, config=None):
+        config = load_config() if config is None else config
         self.token = config.get('telegram_bot_token')
         self.chat_id = config.get('telegram_chat_id')
         self.bot = Bot(token=self.token) if self.token else None
+        self._q: queue.Queue = queue.Queue(maxsize=NOTIFY_QUEUE_MAX)
+        self._worker_thread = None
+        if self.bot and self.chat_id:
+            self._worker_thread = threading.Thread(target=self._worker, name="notifier", daemon=True)
+            self._worker_thread.start()
+            atexit.register(self.close)
 
     def send(self, msg):
-        if not self.bot or not self.chat_id:
+        if not self._worker_thread:
             logger.warning("Telegram não configurado!")
             return
         try:
-            self.bot.send_message(chat_id=self.chat_id, text=msg)
-        except Exception as e:
-            logger.error(f"Erro ao enviar Telegram: {e}")
+            self._q.put_nowait(msg)
+        except queue.Full:
+            logger.error(f"Fila do Telegram cheia, mensagem descartada: {msg}")
+
+    def close(self, timeout: float = 5.0):
+        """Envia o que ainda estiver na fila (até timeout) e encerra a thread."""
+        if not self._worker_thread or not self._worker_thread.is_alive():
+            return
+        try:
+            self._q.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._worker_thread.join(timeout)
+
+    def _next_batch(self, first):
+        """
+        Junta mensagens da fila a partir de `first` enquanto o texto couber em
+        TELEGRAM_MAX_CHARS. Devolve (texto, sobra, parar): `sobra` é a mensagem
+        que não coube e abre o próximo envio; só uma mensagem sozinha maior que
+        o limite é truncada.
+        """
+        parts = [first[:TELEGRAM_MAX_CHARS]]
+        size = len(parts[0])
+        while len(parts) < NOTIFY_BATCH_MAX:
+            try:
+                msg = self._q.get_nowait()
+            except queue.Empty:
+                break
+            if msg is _STOP:
+                return "\n".join(parts), None, True
+            msg = str(msg)
+            if size + 1 + len(msg) > TELEGRAM_MAX_CHARS:
+                return "\n".join(parts), msg, False
+            parts.append(msg)
+            size += 1 + len(msg)
+        return "\n".join(parts), None, False
+
+    def _worker(self):
+        # Bot (v20) é assíncrono: um loop dedicado, o mesmo para todos os envios
+        loop = asyncio.new_event_loop()
+        try:
+            carry = None
+            stop = False
+            while not stop:
+                first = carry if carry is not None else self._q.get()
+                if first is _STOP:
+                    break
+                text, carry, stop = self._next_batch(str(first))
+                try:
+                    loop.run_until_complete(self.bot.send_message(chat_id=self.chat_id, text=text))
+                except Exception as e:
+                    logger.error(f"Erro ao enviar Telegram: {e}")
+        finally:
+            loop.close()
@@ -1,44 +1,58 @@
 # simulator.py
-import time, math, random
+import os
+import time
 from collections import defaultdict
+import numpy as np
 from loguru import logger
+from numba import njit, prange
 
 from bot.config import load_config
 from bot.market_data import MarketDataService
 from bot.strategies import StrategyManager
 from bot.state import set_initial, set_last_tick_now, append_trade
 
-def _mk_kline(t_open_ms, o, h, l, c, v):
-    # formato semelhante ao do WS da Binance (kline fechado)
-    return {
-        "t": int(t_open_ms),
-        "T": int(t_open_ms + 60_000 - 1),
-        "o": f"{o:.8f}",
-        "h": f"{h:.8f}",
-        "l": f"{l:.8f}",
-        "c": f"{c:.8f}",
-        "v": f"{v:.8f}",
-        "x": True,  # closed
-    }
-
-def _rand_candle(prev_close, vol=0.002):
-    # random walk simples: retorno ~ N(0, vol)
-    r = random.gauss(0, vol)
-    c = max(0.00000001, prev_close * (1.0 + r))
+# retorno por candle ~ N(0, VOL); candles "ao vivo" gerados em blocos de LIVE_BATCH
+VOL = 0.002
+LIVE_BATCH = 600
+
+@njit(cache=True)
+def rand_candle(prev_close, vol):
+    """Um candle do random walk a partir de prev_close: (o, h, l, c, v)."""
+    c = max(0.00000001, prev_close * (1.0 + np.random.normal(0.0, vol)))
     o = prev_close
-    h = max(o, c) * (1.0 + abs(random.gauss(0, vol/2)))
-    l = min(o, c) * (1.0 - abs(random.gauss(0, vol/2)))
-    v = abs(random.gauss(100, 30))
+    h = max(o, c) * (1.0 + abs(np.random.normal(0.0, vol / 2)))
+    l = min(o, c) * (1.0 - abs(np.random.normal(0.0, vol / 2)))
+    v = abs(np.random.normal(100.0, 30.0))
     return o, h, l, c, v
 
+@njit(cache=True, parallel=True)
+def rand_candles_batch(prev_closes, vol, n):
+    """
+    n candles seguidos para cada símbolo (prange: um símbolo por thread).
+    out[s] = colunas (o, h, l, c, v) do símbolo s, cada uma com n valores.
+    """
+    out = np.empty((len(prev_closes), 5, n))
+    for s in prange(len(prev_closes)):
+        pc = prev_closes[s]
+        for i in range(n):
+            o, h, l, c, v = rand_candle(pc, vol)
+            out[s, 0, i] = o
+            out[s, 1, i] = h
+            out[s, 2, i] = l
+            out[s, 3, i] = c
+            out[s, 4, i] = v
+            pc = c
+    return out
+
 def main():
     cfg = load_config()
     symbols = [s.upper() for s in cfg["symbols"]]
     interval = (cfg.get("timeframe") or "1m").strip()
 
-    logger.info("🎛️  Iniciando simulador offline | símbolos=%s | timeframe=%s", symbols, interval)
+    logger.info("🎛️  Iniciando simulador offline | símbolos={} | timeframe={}", symbols, interval)
 
-    mds = MarketDataService(maxlen=2000)
+    # BOT_MDS_SHM_DIR (ex.: /dev/shm/bot) => candles em memória compartilhada p/ outros processos
+    mds = MarketDataService(maxlen=2000, shm_dir=os.getenv("BOT_MDS_SHM_DIR"))
     strat_mgr = StrategyManager(cfg, mds)
 
     # estado de posições de papel
@@ -49,33 +63,32 @@ def main():
 
     # preços iniciais razoáveis
     seeds = {"BTCUSDT": 60000.0, "ETHUSDT": 3000.0, "BNBUSDT": 500.0}
-    last_close = {s: seeds.get(s, 100.0 + 50.0*random.random()) for s in symbols}
+    last_close = {s: seeds.get(s, 100.0 + 50.0*np.random.random()) for s in symbols}
 
-    # bootstrap de histórico (200 candles)
+    # bootstrap de histórico (200 candles), gerado e gravado no buffer em bloco
     now_ms = int(time.time()) * 1000
-    start_ms = now_ms - 200 * 60_000
-    for s in symbols:
-        t = start_ms
-        pc = last_close[s]
-        for _ in range(200):
-            o,h,l,c,v = _rand_candle(pc)
-            k = _mk_kline(t, o,h,l,c,v)
-            mds.on_kline_closed(s, interval, k)
-            pc = c
-            t += 60_000
-        last_close[s] = pc
+    open_times = now_ms - 200 * 60_000 + np.arange(200, dtype=np.int64) * 60_000
+    boot = rand_candles_batch(np.array([last_close[s] for s in symbols]), VOL, 200)
+    for j, s in enumerate(symbols):
+        o,h,l,c,v = boot[j]
+        mds.bulk_load(s, interval, open_times, o,h,l,c,v, open_times + 60_000 - 1)
+        last_close[s] = float(c[-1])
 
     logger.info("📈 Histórico sintético preparado. Iniciando geração de candles ao vivo (offline).")
     t_open = now_ms
+    next_tick = time.monotonic()
 
     # loop "ao vivo": a cada ~1s gera um novo candle de 1m
     # (ajuste o sleep se quiser acelerar: p/ 1m por segundo use sleep(1))
+    step = 0
     while True:
-        for s in symbols:
-            # gera candle
-            o,h,l,c,v = _rand_candle(last_close[s])
-            k = _mk_kline(t_open, o,h,l,c,v)
-            mds.on_kline_closed(s, interval, k)
+        i = step % LIVE_BATCH
+        if i == 0:
+            live = rand_candles_batch(np.array([last_close[s] for s in symbols]), VOL, LIVE_BATCH)
+        for j, s in enumerate(symbols):
+            # próximo candle do bloco pré-gerado (numérico, sem passar por string)
+            o,h,l,c,v = live[j, :, i].tolist()
+            mds.on_candle_closed(s, interval, t_open, o,h,l,c,v, t_open + 60_000 - 1)
             last_close[s] = c
 
             # update painel heartbeat
@@ -83,15 +96,15 @@ def main():
 
             # executa estratégias configuradas p/ símbolo
             for strat_name in cfg["strategies"].get(s, []):
-                signal = strat_mgr.get_strategy(strat_name, s).generate_signal()
+                signal = strat_mgr.signal(strat_name, s)
 
                 if signal == "buy" and positions[s]["qty"] <= 0:
                     # compra de papel: usa 50 USDT por trade (ajuste aqui se quiser)
                     quote_usdt = 50.0
                     qty = quote_usdt / c
                     positions[s] = {"qty": qty, "price": c}
-                    append_trade(s, "buy", qty, c, pnl=0.0)
-                    logger.info(f"🟢 [SIM] {s} BUY qty={qty:.6f} @ {c:.6f}")
+                    append_trade(s, "buy", qty, c, pnl=0.0, persist=False)
+                    logger.info("🟢 [SIM] {} BUY qty={:.6f} @ {:.6f}", s, qty, c)
 
                 elif signal == "sell" and positions[s]["qty"] > 0:
                     # venda total da posição
@@ -99,12 +112,20 @@ def main():
                     entry = positions[s]["price"]
                     pnl = (c - entry) * qty
                     positions[s] = {"qty": 0.0, "price": 0.0}
-                    append_trade(s, "sell", qty, c, pnl=pnl)
-                    logger.info(f"🔴 [SIM] {s} SELL qty={qty:.6f} @ {c:.6f} | PnL={pnl:+.4f} USDT")
+                    append_trade(s, "sell", qty, c, pnl=pnl, persist=False)
+                    logger.info("🔴 [SIM] {} SELL qty={:.6f} @ {:.6f} | PnL={:+.4f} USDT", s, qty, c, pnl)
 
         # próximo “minuto” sintético
         t_open += 60_000
-        time.sleep(1)  # 1s = 1 candle de 1m (acelera o teste). Troque para 0.2 p/ ficar mais rápido.
+        step += 1
+        # 1s = 1 candle de 1m (acelera o teste). Troque para 0.2 p/ ficar mais rápido.
+        # prazo absoluto no relógio monotônico: o tempo gasto nas estratégias não acumula drift
+        next_tick += 1.0
+        delay = next_tick - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            next_tick = time.monotonic()  # atrasou: não tenta "compensar" disparando candles em rajada
 
 if __name__ == "__main__":
     main()
@@ -1,105 +1,193 @@
-import json
+import atexit
 import os
 import threading
 import time
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Tuple
+import orjson
 
 STATE_PATH = os.getenv("BOT_STATE_PATH", "state.json")
-_lock = threading.Lock()
+# histórico completo de trades, uma linha JSON por trade (state.json guarda só a cauda)
+TRADES_LOG_PATH = os.getenv("BOT_TRADES_LOG_PATH", os.path.join(os.path.dirname(STATE_PATH), "trades.jsonl"))
+# intervalo do flusher: no máx. uma escrita de state.json por esse período
+FLUSH_INTERVAL_SEC = float(os.getenv("BOT_STATE_FLUSH_SEC", "1.0"))
+TRADES_TAIL = 200
+# BOT_STATE_PRETTY=1 => state.json indentado (inspeção manual); default compacto
+_DUMP_OPTS = orjson.OPT_INDENT_2 if os.getenv("BOT_STATE_PRETTY") == "1" else 0
+_write_lock = threading.Lock()
+# serializa flush() inteiro (snapshot + dump + replace): flusher e atexit não
+# disputam o mesmo .tmp nem trocam um snapshot novo por um velho
+_flush_lock = threading.Lock()
 
 _DEFAULT: Dict[str, Any] = {
     "ws_uptime_start": 0,     # epoch
     "last_tick_ts": 0,        # epoch
     "pnl_daily": 0.0,         # USDT (estimado)
-    "trades": [],             # [{ts, symbol, side, qty, price, pnl}]
+    "trades": [],             # últimos TRADES_TAIL: [{ts, symbol, side, qty, price, pnl}]
     "mode": "trade",          # "trade" | "backtest" (informativo)
     "symbols": [],            # lista de pares
-    "recent_signals": [],     # antirrepique: [{ts, symbol, side, candle_close}]
+    "trade_cursors": {},      # reconciliação incremental: {symbol: {id, qty, pm}}
 }
 
+def _fresh() -> Dict[str, Any]:
+    # cópia profunda: o estado em memória é mutado no lugar
+    return orjson.loads(orjson.dumps(_DEFAULT))
+
 def _read() -> Dict[str, Any]:
     if not os.path.exists(STATE_PATH):
-        return dict(_DEFAULT)
+        return _fresh()
     try:
-        with open(STATE_PATH, "r") as f:
-            data = json.load(f)
+        with open(STATE_PATH, "rb") as f:
+            data = orjson.loads(f.read())
         # sanity defaults
-        for k, v in _DEFAULT.items():
+        for k, v in _fresh().items():
             data.setdefault(k, v)
+        data.pop("recent_signals", None)  # legado: antirrepique agora só em memória
         return data
     except Exception:
-        return dict(_DEFAULT)
+        return _fresh()
 
-def _write(data: Dict[str, Any]) -> None:
+def _write(payload: bytes) -> None:
     tmp = STATE_PATH + ".tmp"
-    with open(tmp, "w") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    with open(tmp, "wb") as f:
+        f.write(payload)
     os.replace(tmp, STATE_PATH)
 
+# --------- estado em memória + flusher ---------
+# Autoritativo neste processo. Quem nunca altera o estado (ex.: o dashboard,
+# outro processo) continua lendo do disco em get().
+# Copy-on-write: _STATE nunca é mutado no lugar; escritores (com _write_lock)
+# publicam um dict novo e leitores pegam a referência atual sem lock.
+_STATE: Dict[str, Any] = _read()
+_owner = False
+_dirty = False
+_flusher = None
+
+def _touch() -> None:
+    """Marca o estado como alterado (chamar com _write_lock) e garante o flusher rodando."""
+    global _owner, _dirty, _flusher
+    _owner = True
+    _dirty = True
+    if _flusher is None:
+        _flusher = threading.Thread(target=_flush_loop, name="state-flusher", daemon=True)
+        _flusher.start()
+        atexit.register(flush)
+
+def _publish(**changes: Any) -> None:
+    """Troca _STATE por uma cópia com as mudanças (chamar com _write_lock)."""
+    global _STATE
+    new = dict(_STATE)
+    new.update(changes)
+    _STATE = new
+    _touch()
+
+def flush() -> None:
+    """Grava state.json agora se houver alterações pendentes."""
+    global _dirty
+    with _flush_lock:
+        with _write_lock:
+            if not _dirty:
+                return
+            snapshot = _STATE
+            _dirty = False
+        try:
+            _write(orjson.dumps(snapshot, option=_DUMP_OPTS))
+        except OSError:
+            with _write_lock:
+                _dirty = True  # tenta de novo na próxima volta
+
+def _flush_loop() -> None:
+    while True:
+        time.sleep(FLUSH_INTERVAL_SEC)
+        flush()
+
 def get() -> Dict[str, Any]:
-    with _lock:
+    if not _owner:
         return _read()
+    return dict(_STATE)
 
 def set_initial(mode: str, symbols: List[str]) -> None:
-    with _lock:
-        st = _read()
-        st["ws_uptime_start"] = int(time.time())
-        st["last_tick_ts"] = 0
-        st["pnl_daily"] = 0.0
-        st["trades"] = []
-        st["mode"] = mode
-        st["symbols"] = symbols
-        st["recent_signals"] = []
-        _write(st)
-
-def set_last_tick_now() -> None:
-    with _lock:
-        st = _read()
-        st["last_tick_ts"] = int(time.time())
-        _write(st)
-
-def append_trade(symbol: str, side: str, qty: float, price: float, pnl: float = 0.0) -> None:
-    with _lock:
-        st = _read()
-        st["trades"].append({
-            "ts": int(time.time()),
-            "symbol": symbol,
-            "side": side,
-            "qty": float(qty),
-            "price": float(price),
-            "pnl": float(pnl),
-        })
-        st["trades"] = st["trades"][-200:]  # mantém só os últimos 200
-        st["pnl_daily"] = float(st.get("pnl_daily", 0.0)) + float(pnl or 0.0)
-        _write(st)
+    with _write_lock:
+        _publish(ws_uptime_start=int(time.time()), last_tick_ts=0, pnl_daily=0.0,
+                 trades=[], mode=mode, symbols=list(symbols))
+        _RECENT.clear()
+
+def set_last_tick_now(ts: Optional[float] = None) -> None:
+    """Atualiza last_tick_ts (resolução de 1s: ticks no mesmo segundo não republicam o estado)."""
+    now = int(time.time() if ts is None else ts)
+    if _STATE.get("last_tick_ts") == now:
+        return
+    with _write_lock:
+        _publish(last_tick_ts=now)
+
+def append_trade(symbol: str, side: str, qty: float, price: float, pnl: float = 0.0,
+                 persist: bool = True) -> None:
+    """
+    Registra o trade na cauda do state.json (painel) e no pnl_daily.
+    persist=False (backtest/simulação): fora do trades.jsonl, que é só de trades reais.
+    """
+    trade = {
+        "ts": int(time.time()),
+        "symbol": symbol,
+        "side": side,
+        "qty": float(qty),
+        "price": float(price),
+        "pnl": float(pnl),
+    }
+    line = orjson.dumps(trade) + b"\n" if persist else b""
+    with _write_lock:
+        if persist:
+            with open(TRADES_LOG_PATH, "ab") as f:
+                f.write(line)
+        st = _STATE
+        _publish(
+            trades=(st["trades"] + [trade])[-TRADES_TAIL:],  # mantém só os últimos TRADES_TAIL
+            pnl_daily=float(st.get("pnl_daily", 0.0)) + float(pnl or 0.0),
+        )
 
 # --------- antirrepique / idempotência de sinais ---------
+# só em memória: (symbol, side, candle_close) -> ts; expiração preguiçosa
+_RECENT: Dict[Tuple[str, str, int], int] = {}
+_RECENT_PRUNE_EVERY = 100
+_recent_inserts = 0
+
+def _insert_recent(key: Tuple[str, str, int], now: int, ttl_sec: int) -> None:
+    """Registra o sinal e, a cada _RECENT_PRUNE_EVERY inserções, expira os velhos (chamar com _write_lock)."""
+    global _recent_inserts
+    _RECENT[key] = now
+    _recent_inserts += 1
+    if _recent_inserts % _RECENT_PRUNE_EVERY == 0:
+        for k in [k for k, ts in _RECENT.items() if now - ts > ttl_sec]:
+            del _RECENT[k]
+
 def add_recent_signal(symbol: str, side: str, candle_close: int, ttl_sec: int = 30) -> None:
+    with _write_lock:
+        _insert_recent((symbol, side, int(candle_close)), int(time.time()), ttl_sec)
+
+def try_claim_signal(symbol: str, side: str, candle_close: int, ttl_sec: int = 30) -> bool:
+    """
+    is_recent_signal + add_recent_signal numa operação só: True na primeira vez
+    que o sinal aparece dentro do ttl (e o registra), False se já foi visto.
+    """
+    key = (symbol, side, int(candle_close))
     now = int(time.time())
-    with _lock:
-        st = _read()
-        arr = st.get("recent_signals", [])
-        arr.append({"ts": now, "symbol": symbol, "side": side, "candle_close": int(candle_close)})
-        # prune
-        arr = [x for x in arr if (now - int(x.get("ts", now))) <= ttl_sec]
-        st["recent_signals"] = arr[-500:]
-        _write(st)
+    with _write_lock:
+        ts = _RECENT.get(key)
+        if ts is not None and now - ts <= ttl_sec:
+            return False
+        _insert_recent(key, now, ttl_sec)
+        return True
 
 def is_recent_signal(symbol: str, side: str, candle_close: int, ttl_sec: int = 30) -> bool:
-    now = int(time.time())
-    with _lock:
-        st = _read()
-        arr = st.get("recent_signals", [])
-        # prune enquanto verifica
-        kept = []
-        hit = False
-        for x in arr:
-            if (now - int(x.get("ts", now))) <= ttl_sec:
-                kept.append(x)
-                if (x.get("symbol") == symbol and
-                    x.get("side") == side and
-                    int(x.get("candle_close", 0)) == int(candle_close)):
-                    hit = True
-        st["recent_signals"] = kept[-500:]
-        _write(st)
-        return hit
+    ts = _RECENT.get((symbol, side, int(candle_close)))
+    return ts is not None and int(time.time()) - ts <= ttl_sec
+
+# --------- cursor de reconciliação (myTrades incremental) ---------
+def get_trade_cursor(symbol: str) -> Dict[str, Any]:
+    """Último trade id já processado + posição (qty, pm) reconstruída até ele; {} se nunca reconciliou."""
+    return dict(_STATE.get("trade_cursors", {}).get(symbol, {}))
+
+def save_trade_cursor(symbol: str, trade_id: int, qty: float, pm: float) -> None:
+    with _write_lock:
+        cursors = dict(_STATE.get("trade_cursors", {}))
+        cursors[symbol] = {"id": int(trade_id), "qty": float(qty), "pm": float(pm)}
+        _publish(trade_cursors=cursors)
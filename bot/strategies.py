@@ -1,7 +1,30 @@
 # bot/strategies.py
-import ta
+from typing import Optional
+
+import numpy as np
+from bot.indicators import ema_alpha, ema_batch, ema_update, rsi_batch, rsi_state, rsi_update, rsi_value
 from bot.market_data import MarketDataService
 
+# codificação numérica dos sinais (séries vetorizadas do backtest)
+SIGNAL_SELL, SIGNAL_HOLD, SIGNAL_BUY = -1, 0, 1
+SIGNAL_NAMES = {SIGNAL_SELL: "sell", SIGNAL_HOLD: "hold", SIGNAL_BUY: "buy"}
+# índice: sign(fast-slow) atual - sign anterior + 2 (0 = cruzou pra baixo, 4 = pra cima)
+_CROSS_SIGNAL = ("sell", "hold", "hold", "hold", "buy")
+
+def _unseen_closes(arrays, last_open_time) -> Optional[np.ndarray]:
+    """
+    Closes dos candles posteriores a last_open_time (vazio se nada novo).
+    None quando o estado incremental não tem como continuar (ainda não
+    semeado, ou o buffer pulou candles) e precisa ser recalculado do buffer.
+    """
+    ot = arrays["open_time"]
+    if last_open_time is None or len(ot) == 0 or ot[0] > last_open_time:
+        return None
+    k = int(np.searchsorted(ot, last_open_time, side="right"))
+    if ot[k - 1] != last_open_time:
+        return None
+    return arrays["close"][k:]
+
 class EMACrossStrategy:
     def __init__(self, symbol, fast_period, slow_period, mds: MarketDataService, interval="1m"):
         self.symbol = symbol
@@ -9,24 +32,53 @@ class EMACrossStrategy:
         self.slow = slow_period
         self.mds = mds
         self.interval = interval
+        # estado incremental: EMAs do último candle + diferença fast-slow atual e anterior
+        self._alpha_fast = ema_alpha(fast_period)
+        self._alpha_slow = ema_alpha(slow_period)
+        self._last_open_time = None
+        self._ema_fast = self._ema_slow = np.nan
+        self._prev_diff = self._curr_diff = np.nan
+
+    def _seed(self, close):
+        fast = ema_batch(close, self.fast)
+        slow = ema_batch(close, self.slow)
+        self._ema_fast, self._ema_slow = float(fast[-1]), float(slow[-1])
+        self._prev_diff, self._curr_diff = float(fast[-2] - slow[-2]), float(fast[-1] - slow[-1])
 
     def generate_signal(self):
-        df = self.mds.get_df(self.symbol, self.interval)
-        if df.empty or len(df) < (self.slow + 2):
+        arrays = self.mds.get_arrays(self.symbol, self.interval)
+        close = arrays["close"]
+        if len(close) < (self.slow + 2):
             return "hold"
-        df = df.copy()
-        df['ema_fast'] = ta.trend.ema_indicator(df['close'], self.fast)
-        df['ema_slow'] = ta.trend.ema_indicator(df['close'], self.slow)
-
-        cruzou_pra_cima = df['ema_fast'].iloc[-2] < df['ema_slow'].iloc[-2] and df['ema_fast'].iloc[-1] > df['ema_slow'].iloc[-1]
-        if cruzou_pra_cima:
-            return "buy"
+        new = _unseen_closes(arrays, self._last_open_time)
+        if new is None:
+            self._seed(close)
+        else:
+            for x in new:
+                self._ema_fast = ema_update(self._ema_fast, x, self._alpha_fast)
+                self._ema_slow = ema_update(self._ema_slow, x, self._alpha_slow)
+                self._prev_diff, self._curr_diff = self._curr_diff, self._ema_fast - self._ema_slow
+        self._last_open_time = arrays["open_time"][-1]
 
-        cruzou_pra_baixo = df['ema_fast'].iloc[-2] > df['ema_slow'].iloc[-2] and df['ema_fast'].iloc[-1] < df['ema_slow'].iloc[-1]
-        if cruzou_pra_baixo:
-            return "sell"
+        # cruzamento = troca de sinal de (fast - slow): sign(atual) - sign(anterior) é ±2
+        prev, curr = self._prev_diff, self._curr_diff
+        step = ((curr > 0) - (curr < 0)) - ((prev > 0) - (prev < 0))
+        return _CROSS_SIGNAL[step + 2]
 
-        return "hold"
+    def signal_series(self, close: np.ndarray) -> np.ndarray:
+        """
+        Versão vetorizada de generate_signal: out[i] é o sinal que seria
+        emitido com o histórico close[:i+1] (int8: -1 sell, 0 hold, +1 buy).
+        """
+        fast = ema_batch(close, self.fast)
+        slow = ema_batch(close, self.slow)
+        out = np.zeros(len(close), dtype=np.int8)
+        d = np.sign(fast - slow)
+        step = d[1:] - d[:-1]  # NaN no aquecimento: nunca é ±2
+        out[1:][step == 2] = SIGNAL_BUY
+        out[1:][step == -2] = SIGNAL_SELL
+        out[:self.slow + 1] = SIGNAL_HOLD
+        return out
 
 class RSIStrategy:
     def __init__(self, symbol, period, overbought, oversold, mds: MarketDataService, interval="1m"):
@@ -36,14 +88,30 @@ class RSIStrategy:
         self.oversold = oversold
         self.mds = mds
         self.interval = interval
+        # estado incremental: médias de Wilder + último close consumido
+        self._last_open_time = None
+        self._avg_gain = self._avg_loss = 0.0
+        self._prev_close = np.nan
+        self._rsi = np.nan
 
     def generate_signal(self):
-        df = self.mds.get_df(self.symbol, self.interval)
-        if df.empty or len(df) < (self.period + 2):
+        arrays = self.mds.get_arrays(self.symbol, self.interval)
+        close = arrays["close"]
+        if len(close) < (self.period + 2):
             return "hold"
-        df = df.copy()
-        df['rsi'] = ta.momentum.rsi(df['close'], self.period)
-        last_rsi = float(df['rsi'].iloc[-1])
+        new = _unseen_closes(arrays, self._last_open_time)
+        if new is None:
+            self._avg_gain, self._avg_loss = rsi_state(close, self.period)
+            self._rsi = rsi_value(self._avg_gain, self._avg_loss)
+        else:
+            for x in new:
+                self._avg_gain, self._avg_loss, self._rsi = rsi_update(
+                    self._avg_gain, self._avg_loss, self._prev_close, x, self.period
+                )
+                self._prev_close = x
+        self._last_open_time = arrays["open_time"][-1]
+        self._prev_close = close[-1]
+        last_rsi = float(self._rsi)
 
         if last_rsi > self.overbought:
             return "sell"
@@ -51,6 +119,16 @@ class RSIStrategy:
             return "buy"
         return "hold"
 
+    def signal_series(self, close: np.ndarray) -> np.ndarray:
+        """Versão vetorizada de generate_signal (mesma codificação de EMACrossStrategy)."""
+        rsi = rsi_batch(close, self.period)
+        out = np.zeros(len(close), dtype=np.int8)
+        with np.errstate(invalid="ignore"):
+            out[rsi < self.oversold] = SIGNAL_BUY
+            out[rsi > self.overbought] = SIGNAL_SELL
+        out[:self.period + 1] = SIGNAL_HOLD
+        return out
+
 class StrategyManager:
     def __init__(self, config, market_data: MarketDataService):
         """
@@ -60,6 +138,7 @@ class StrategyManager:
         self.mds = market_data
         self.interval = (config.get("timeframe") or "1m").strip()
         self._strategies = {}
+        self._last_eval = {}  # (estratégia, símbolo, tf) -> (close_time avaliado, sinal)
 
     def get_strategy(self, name, symbol):
         # Singleton por (estratégia, símbolo)
@@ -89,3 +168,27 @@ class StrategyManager:
             # Adicione novas estratégias aqui, sempre usando self.mds e self.interval
 
         return self._strategies[key]
+
+    def signal(self, name, symbol) -> str:
+        """
+        generate_signal da estratégia, mas só recalcula se entrou candle novo
+        (close_time avançou) desde a última avaliação; senão devolve o mesmo sinal.
+        """
+        key = (name, symbol, self.interval)
+        close_time = self.mds.last_close_time(symbol, self.interval)
+        cached = self._last_eval.get(key)
+        if cached is not None and close_time is not None and cached[0] == close_time:
+            return cached[1]
+        signal = self.get_strategy(name, symbol).generate_signal()
+        self._last_eval[key] = (close_time, signal)
+        return signal
+
+    def vectorized_signal(self, name, symbol, close: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Série completa de sinais (int8) para o backtest, ou None se a estratégia
+        não tiver versão vetorizada (aí o backtest usa generate_signal por candle).
+        """
+        strategy = self.get_strategy(name, symbol)
+        if not hasattr(strategy, "signal_series"):
+            return None
+        return strategy.signal_series(np.asarray(close, dtype=np.float64))
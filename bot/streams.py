@@ -0,0 +1,26 @@
+"""
+BinanceSocketManager com decodificação das mensagens via orjson.
+O python-binance usa o json da stdlib em ReconnectingWebsocket._handle_message;
+com vários símbolos multiplexados o parse de cada kline pesa no loop.
+Importe BinanceSocketManager daqui para garantir o patch.
+"""
+import gzip
+import orjson
+from binance.streams import BinanceSocketManager, ReconnectingWebsocket
+
+def _handle_message(self, evt):
+    # mesmo contrato do original: gzip se binário, None se não for JSON válido
+    if self._is_binary:
+        try:
+            evt = gzip.decompress(evt)
+        except (ValueError, OSError):
+            return None
+    try:
+        return orjson.loads(evt)
+    except orjson.JSONDecodeError:
+        self._log.debug(f'error parsing evt json:{evt}')
+        return None
+
+ReconnectingWebsocket._handle_message = _handle_message
+
+__all__ = ["BinanceSocketManager"]
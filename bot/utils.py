@@ -1,16 +1,74 @@
 import datetime
+import functools
 import math
-import string
+import os
+import threading
 import time
 import random
+from collections import deque
+from typing import Callable, Dict, Hashable, Optional, Tuple
 from loguru import logger
 
 def timestamp():
     return datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
 def normalize_symbol(sym: str) -> str:
-    # Binance symbols são MAIÚSCULOS (ex.: BTCUSDT)
-    return (sym or "").upper()
+    """Normaliza símbolo para padrão Binance: MAIÚSCULO e sem separadores ("btc/usdt" -> BTCUSDT)."""
+    return (sym or "").replace("/", "").upper()
+
+# flags (pause/timeframe) são consultadas a cada candle/request: um stat a cada 250ms basta
+STAT_TTL_SEC = 0.25
+
+@functools.lru_cache(maxsize=8)
+def _stat_bucket(path: str, bucket: int):
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+def stat_cached(path: str) -> Optional[os.stat_result]:
+    """os.stat(path) (None se não existir) reaproveitado por até STAT_TTL_SEC."""
+    return _stat_bucket(path, int(time.monotonic() / STAT_TTL_SEC))
+
+stat_cached.cache_clear = _stat_bucket.cache_clear
+
+_flag_cache: Dict[str, Tuple[Tuple[int, int], str]] = {}
+
+def read_flag(path: str) -> Optional[str]:
+    """
+    Conteúdo (strip) de um arquivo-flag; None se não existir ou não der para ler.
+    Só relê o arquivo quando mtime/tamanho mudam.
+    """
+    st = stat_cached(path)
+    if st is None:
+        return None
+    sig = (st.st_mtime_ns, st.st_size)
+    hit = _flag_cache.get(path)
+    if hit and hit[0] == sig:
+        return hit[1]
+    try:
+        with open(path, "r") as f:
+            text = f.read().strip()
+    except OSError:
+        return None
+    _flag_cache[path] = (sig, text)
+    return text
+
+_INTERVAL_UNIT_SEC = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800, "M": 2592000}
+
+def interval_seconds(interval: str) -> int:
+    """Duração de um timeframe da Binance em segundos ("1m" -> 60, "4h" -> 14400; "1M" ~ 30d)."""
+    return int(interval[:-1]) * _INTERVAL_UNIT_SEC[interval[-1]]
+
+def next_boundary_delay(period_sec: float, offset: float = 0.0) -> float:
+    """
+    Segundos até o próximo múltiplo de period_sec no relógio epoch (onde a
+    Binance fecha os klines) + offset. Recalcular a cada ciclo evita o drift
+    acumulado de um sleep fixo.
+    """
+    now = time.time()
+    target = (now - offset) // period_sec * period_sec + period_sec + offset
+    return max(0.0, target - now)
 
 def round_step(value: float, step: float) -> float:
     if step <= 0:
@@ -22,13 +80,162 @@ def round_tick(price: float, tick: float) -> float:
         return price
     return math.floor(price / tick) * tick
 
+_CROCKFORD = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_ULID_LOCK = threading.Lock()
+_ulid_last_ms = -1
+_ulid_last_rand = 0
+
+def _ulid() -> str:
+    """
+    ULID (26 chars Crockford base32: 48 bits de ms + 80 bits aleatórios),
+    monotônico: no mesmo ms incrementa a parte aleatória, então a ordem
+    lexicográfica segue a ordem de geração.
+    """
+    global _ulid_last_ms, _ulid_last_rand
+    with _ULID_LOCK:
+        ms = time.time_ns() // 1_000_000
+        if ms <= _ulid_last_ms:
+            ms = _ulid_last_ms
+            _ulid_last_rand = (_ulid_last_rand + 1) & ((1 << 80) - 1)
+        else:
+            _ulid_last_ms = ms
+            _ulid_last_rand = random.getrandbits(80)
+        n = (ms << 80) | _ulid_last_rand
+    return "".join(_CROCKFORD[(n >> shift) & 31] for shift in range(125, -1, -5))
+
 def gen_client_order_id(prefix="bot"):
-    rand = ''.join(random.choices(string.ascii_lowercase + string.digits, k=8))
-    return f"{prefix}_{int(datetime.datetime.now().timestamp())}_{rand}"
+    # Binance aceita até 36 chars em newClientOrderId: prefixo é truncado, o ULID nunca
+    return f"{prefix[:9]}_{_ulid()}"
+
+def ttl_cache(ttl: float, maxsize: int = 256, key: Optional[Callable[..., Hashable]] = None):
+    """
+    Memoiza um método por argumentos durante `ttl` segundos (relógio monotônico).
+    O cache é por instância (testnet/produção ou dublês não se misturam) e
+    protegido por lock (chamadas via to_thread). `key(*args, **kwargs)` define a
+    chave; o padrão são os próprios argumentos. Ao passar de `maxsize`,
+    descarta a entrada mais antiga.
+    """
+    def deco(fn):
+        attr = f"_ttl_cache_{fn.__name__}"
+        lock = threading.Lock()
+
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            k = key(*args, **kwargs) if key else (args, tuple(sorted(kwargs.items())))
+            now = time.monotonic()
+            with lock:
+                cache = self.__dict__.setdefault(attr, {})
+                hit = cache.get(k)
+            if hit and hit[0] > now:
+                return hit[1]
+            value = fn(self, *args, **kwargs)
+            with lock:
+                cache = self.__dict__.setdefault(attr, {})
+                cache.pop(k, None)
+                cache[k] = (now + ttl, value)
+                if len(cache) > maxsize:
+                    cache.pop(next(iter(cache)))
+            return value
+
+        def cache_clear(self):
+            with lock:
+                self.__dict__.pop(attr, None)
+
+        wrapper.cache_clear = cache_clear
+        return wrapper
+    return deco
+
+class CircuitOpenError(RuntimeError):
+    """Chamada recusada localmente porque o circuito está aberto."""
+
+class CircuitBreaker:
+    """
+    Disjuntor closed/open/half-open para chamadas a um serviço externo:
+    - abre após `threshold` falhas dentro de `window` segundos
+    - aberto por `cooldown` segundos: allow() nega na hora, sem tocar a rede
+    - depois libera uma única chamada de teste (half-open): sucesso fecha, falha reabre
+    on_change(state) é chamado a cada transição (ex.: avisar no Telegram).
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str = "binance", threshold: int = 5, window: float = 30.0,
+                 cooldown: float = 30.0, on_change: Optional[Callable[[str], None]] = None):
+        self.name = name
+        self.threshold = threshold
+        self.window = window
+        self.cooldown = cooldown
+        self.on_change = on_change
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self._failures = deque()
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    return False
+                changed = self._set(self.HALF_OPEN)
+            else:
+                changed = False
+            allowed = not self._probing
+            self._probing = True
+        if changed:
+            self._notify(self.HALF_OPEN)
+        return allowed
+
+    def record_success(self):
+        with self._lock:
+            self._failures.clear()
+            self._probing = False
+            changed = self._set(self.CLOSED)
+        if changed:
+            self._notify(self.CLOSED)
+
+    def release(self):
+        """
+        Encerra sem veredito a chamada de teste do half-open (erro que não diz
+        nada sobre o serviço): a próxima chamada vira o novo teste.
+        """
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            now = time.monotonic()
+            self._probing = False
+            self._failures.append(now)
+            while self._failures and now - self._failures[0] > self.window:
+                self._failures.popleft()
+            trip = self.state == self.HALF_OPEN or len(self._failures) >= self.threshold
+            changed = self._set(self.OPEN) if trip else False
+        if changed:
+            self._notify(self.OPEN)
+
+    def _set(self, state: str) -> bool:
+        if state == self.state:
+            return False
+        self.state = state
+        if state == self.OPEN:
+            self.opened_at = time.monotonic()
+            self._failures.clear()
+        return True
 
-def normalize_symbol(symbol: str) -> str:
-    """Normaliza símbolo para padrão Binance (sem separadores)."""
-    return symbol.replace("/", "").upper()
+    def _notify(self, state: str):
+        if state == self.OPEN:
+            logger.error(f"🔌 Circuito {self.name} ABERTO: chamadas recusadas por {self.cooldown:.0f}s.")
+        elif state == self.HALF_OPEN:
+            logger.warning(f"🔌 Circuito {self.name} meio-aberto: testando com uma chamada…")
+        else:
+            logger.info(f"🔌 Circuito {self.name} fechado: serviço normalizado.")
+        if self.on_change:
+            try:
+                self.on_change(state)
+            except Exception as e:
+                logger.warning(f"on_change do circuito {self.name} falhou: {e}")
 
 def binance_request_with_retry(func, *args, max_retries=5, **kwargs):
     """
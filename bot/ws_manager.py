@@ -1,23 +1,33 @@
 import asyncio
 import os
 import time
-from binance.client import Client
-from binance.streams import BinanceSocketManager
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from bot.streams import BinanceSocketManager
 from loguru import logger
 
-from bot.config import load_config
-from bot.utils import normalize_symbol
-from bot.market_data import MarketDataService
-from bot.strategies import StrategyManager
-from bot.risk import RiskManager
-from bot.notifier import Notifier
-from bot.ia import IAManager
+from bot.utils import normalize_symbol, read_flag, stat_cached
+from bot.context import AppContext
 from bot.execution import ExecutionService
-from bot.binance_client import BinanceClient
-from bot.state import set_initial, set_last_tick_now, is_recent_signal, add_recent_signal
+from bot.binance_client import get_binance_client
+from bot.state import set_initial, set_last_tick_now, try_claim_signal
+
+try:
+    import uvloop  # loop em C (libuv); opcional, não existe no Windows
+except ImportError:
+    uvloop = None
 
 PAUSE_FLAG = os.getenv("BOT_PAUSE_FLAG", "pause.flag")
 TF_FLAG = os.getenv("BOT_TIMEFRAME_FLAG", "timeframe.flag")
+# threads do bootstrap REST (uma requisição de klines por símbolo)
+BOOTSTRAP_WORKERS = 8
+# candles fechados aguardando avaliação / lote máximo drenado por vez pelo consumidor
+CANDLE_QUEUE_MAX = 10_000
+CANDLE_BATCH_MAX = 32
+# mensagens do socket processadas por volta do loop de leitura
+WS_BATCH_MAX = 32
+# renovação periódica do saldo USDT em cache (além do refresh após cada ordem executada)
+BALANCE_REFRESH_SEC = 30
 
 VALID_TIMEFRAMES = {
     "1s","1m","3m","5m","15m","30m",
@@ -26,18 +36,25 @@ VALID_TIMEFRAMES = {
 }
 
 class WebSocketBot:
-    def __init__(self):
-        self.config = load_config()
-        self.client = Client(self.config['binance_api_key'], self.config['binance_api_secret'])
-        self.client.API_URL = self.config['binance_api_url']
+    def __init__(self, ctx: Optional[AppContext] = None):
+        # mesmo Client/pool HTTP do restante do processo (execução, IA, bootstrap)
+        ctx = ctx or AppContext.build(get_binance_client())
+        self.ctx = ctx
+        self.config = ctx.config
+        self.client = ctx.binance.client
         ambiente = 'TESTNET' if self.config.get('testnet') else 'PRODUÇÃO'
         logger.info(f"🔧 WebSocket conectando na Binance SPOT {ambiente}")
 
-        self.symbols_lower = [s.lower() for s in self.config['symbols']]
         self.symbols_upper = [normalize_symbol(s) for s in self.config['symbols']]
+        self.symbols_lower = [s.lower() for s in self.symbols_upper]
+        self._streams_by_tf = {}  # timeframe -> nomes dos streams (reconexão reaproveita)
+        # k['s'] do WS -> símbolo normalizado, sem normalize_symbol por mensagem
+        self._sym_map = {}
+        for s in self.symbols_upper:
+            self._sym_map[s] = self._sym_map[s.lower()] = s
 
         self.bsm = BinanceSocketManager(self.client)
-        self.mds = MarketDataService(maxlen=2000)
+        self.mds = ctx.mds
 
         # timeframe inicial: flag > config.yaml > 1m
         self.timeframe = self._read_timeframe()
@@ -45,19 +62,25 @@ class WebSocketBot:
         self._tf_last_mtime = self._flag_mtime()
 
         # Bootstrap REST
-        rest = BinanceClient()
-        for sym in self.symbols_upper:
-            self.mds.bootstrap_from_rest(rest.client, sym, self.timeframe, limit=200)
+        self._bootstrap_all()
 
-        self.risk = RiskManager(self.config['risk'])
-        self.notifier = Notifier()
-        self.exec = ExecutionService(self.risk, notifier=self.notifier)
-        self.strategies = StrategyManager(self.config, self.mds)
-        self.ia_manager = IAManager(self.config) if self.config.get('ia', {}).get('enabled') else None
+        self.risk = ctx.risk
+        self.notifier = ctx.notifier
+        self.exec = ExecutionService(self.risk, notifier=self.notifier, client=ctx.binance)
+        self.strategies = ctx.strategies
+        self.ia_manager = ctx.ia_manager
 
         set_initial(self.config.get("mode", "trade"), self.symbols_upper)
         self._last_msg_ts = time.time()
         self._heartbeat_timeout = 15
+        self._q: asyncio.Queue = asyncio.Queue(maxsize=CANDLE_QUEUE_MAX)
+        self._watchdog_task: Optional[asyncio.Task] = None
+        self._bg_tasks: List[asyncio.Task] = []
+        try:
+            self._usdt_free = ctx.binance.get_balance('USDT')
+        except Exception as e:
+            logger.warning(f"Saldo USDT inicial indisponível: {e}")
+            self._usdt_free = 0.0
 
         # Reconcilia posições/PM no start
         try:
@@ -65,78 +88,137 @@ class WebSocketBot:
         except Exception as e:
             logger.warning(f"Reconciliação inicial falhou: {e}")
 
+    def _bootstrap_all(self):
+        """Histórico REST (200 candles) de todos os símbolos em paralelo: ~1 RTT em vez de N."""
+        workers = max(1, min(BOOTSTRAP_WORKERS, len(self.symbols_upper)))
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            list(ex.map(lambda sym: self.mds.bootstrap_from_rest(self.client, sym, self.timeframe, limit=200),
+                        self.symbols_upper))
+
     def _read_timeframe(self) -> str:
-        if os.path.exists(TF_FLAG):
-            try:
-                tf = open(TF_FLAG).read().strip()
-                if tf in VALID_TIMEFRAMES:
-                    return tf
-            except Exception:
-                pass
+        tf = read_flag(TF_FLAG)
+        if tf in VALID_TIMEFRAMES:
+            return tf
         tf = (self.config.get("timeframe") or "1m").strip()
         return tf if tf in VALID_TIMEFRAMES else "1m"
 
     def _flag_mtime(self) -> float:
-        try:
-            return os.path.getmtime(TF_FLAG)
-        except Exception:
-            return 0.0
+        st = stat_cached(TF_FLAG)
+        return st.st_mtime if st else 0.0
 
     def _is_paused(self) -> bool:
-        return os.path.exists(PAUSE_FLAG)
+        return stat_cached(PAUSE_FLAG) is not None
+
+    @staticmethod
+    async def _drain(stream, max_batch: int = WS_BATCH_MAX) -> list:
+        """
+        Um await em recv() e depois tudo que já estiver na fila interna do socket
+        (até max_batch), sem novo round-trip pelo loop. Candles fechados repetidos
+        (mesmo símbolo e open_time) ficam só com o último.
+        """
+        msgs = [await stream.recv()]
+        q = getattr(stream, "_queue", None)  # asyncio.Queue do ReconnectingWebsocket
+        while q is not None and len(msgs) < max_batch and not q.empty():
+            msgs.append(q.get_nowait())
+        out, closed = [], {}
+        for msg in msgs:
+            msg = msg.get('data', msg)  # multiplex embrulha em {"stream", "data"}
+            k = msg.get('k')
+            if msg.get('e') == 'kline' and k and k.get('x'):
+                key = (k.get('s'), k.get('t'))
+                if key in closed:
+                    out[closed[key]] = msg
+                    continue
+                closed[key] = len(out)
+            out.append(msg)
+        return out
 
     async def handle_candles(self, msg):
         if msg.get('e') != 'kline':
             return
-        self._last_msg_ts = time.time()
-        set_last_tick_now()
+        ts = time.time()
+        self._last_msg_ts = ts
+        set_last_tick_now(ts)
 
         k = msg['k']
-        symbol = normalize_symbol(k['s'])
-        is_closed = bool(k['x'])
+        if not k['x']:
+            return  # candle em aberto: só conta como heartbeat
 
-        if is_closed:
-            self.mds.on_kline_closed(symbol, self.timeframe, k)
-            close_price = float(k['c'])
-            candle_close_ts = int(k['T'])
-            logger.info(f"[{symbol}] Candle {self.timeframe} fechado - Close: {close_price}")
+        symbol = self._sym_map.get(k['s']) or normalize_symbol(k['s'])
+        # ingestão no buffer é imediata; estratégias rodam no consumidor da fila
+        self.mds.on_kline_closed(symbol, self.timeframe, k)
+        try:
+            self._q.put_nowait((symbol, float(k['c']), int(k['T'])))
+        except asyncio.QueueFull:
+            logger.error(f"[{symbol}] Fila de candles cheia, candle descartado da avaliação.")
+
+    async def _consumer(self):
+        """Drena a fila em lotes de até CANDLE_BATCH_MAX; avalia cada símbolo uma vez, no candle mais novo."""
+        while True:
+            batch = [await self._q.get()]
+            while len(batch) < CANDLE_BATCH_MAX and not self._q.empty():
+                batch.append(self._q.get_nowait())
+            latest = {}
+            for symbol, close_price, candle_close_ts in batch:
+                prev = latest.get(symbol)
+                if prev is None or candle_close_ts >= prev[1]:
+                    latest[symbol] = (close_price, candle_close_ts)
+            for symbol, (close_price, candle_close_ts) in latest.items():
+                try:
+                    await self._on_closed_candle(symbol, close_price, candle_close_ts)
+                except Exception as e:
+                    logger.exception(f"[{symbol}] Erro ao processar candle: {e}")
+
+    async def _on_closed_candle(self, symbol: str, close_price: float, candle_close_ts: int):
+        logger.info("[{}] Candle {} fechado - Close: {}", symbol, self.timeframe, close_price)
 
-            # Proteção por software (SL/TP) — se OCO não foi possível:
+        # proteção por software (SL/TP, se OCO não foi possível) e ajuste da IA podem
+        # bater na REST: rodam em threads, juntas, fora do loop
+        tasks = [asyncio.to_thread(self.exec.check_protective_exit, symbol, close_price)]
+        if self.ia_manager:
+            tasks.append(asyncio.to_thread(self.ia_manager.check_and_update_params, symbol, self.strategies))
+        protect_err, *ia_err = await asyncio.gather(*tasks, return_exceptions=True)
+        if isinstance(protect_err, Exception):
+            logger.warning(f"[{symbol}] watchdog proteção falhou: {protect_err}")
+        if ia_err and isinstance(ia_err[0], Exception):
+            logger.warning(f"[IA] Falha no ajuste {symbol}: {ia_err[0]}")
+
+        # estratégias no próprio loop (depois da IA, que mexe nos parâmetros): são
+        # O(1) incrementais e leem views sem cópia dos buffers que handle_candles escreve
+        strats = self.config['strategies'].get(symbol, [])
+        for strat_name in strats:
             try:
-                self.exec.check_protective_exit(symbol, close_price)
+                signal = self.strategies.signal(strat_name, symbol)
+                logger.info("[{}] Estratégia {} => Sinal: {}", symbol, strat_name, signal)
+
+                if self.config['mode'] == "trade" and signal in ["buy", "sell"]:
+                    # idempotência: evita duplicar sinal por candle
+                    if not try_claim_signal(symbol, signal, candle_close_ts, ttl_sec=30):
+                        logger.warning("[{}] Sinal {} ignorado (antirrepique).", symbol, signal)
+                        continue
+
+                    if self._is_paused():
+                        logger.warning("⏸️  Trading pausado (pause.flag). Ignorando sinais.")
+                        continue
+
+                    result = await asyncio.to_thread(self.exec.place_signal, symbol, signal, self._usdt_free, close_price)
+                    if result and result.get("executed"):
+                        await self._refresh_balance()  # ordem própria mudou o saldo
             except Exception as e:
-                logger.warning(f"[{symbol}] watchdog proteção falhou: {e}")
+                logger.exception(f"[{symbol}] Erro na estratégia {strat_name}: {e}")
+                self.notifier.send(f"❌ [{symbol}] Erro estratégia {strat_name}: {e}")
 
-            if self.ia_manager:
-                try:
-                    self.ia_manager.check_and_update_params(symbol, self.strategies)
-                except Exception as e:
-                    logger.warning(f"[IA] Falha no ajuste {symbol}: {e}")
+    async def _refresh_balance(self):
+        try:
+            self._usdt_free = await asyncio.to_thread(self.ctx.binance.get_balance, 'USDT')
+        except Exception as e:
+            logger.warning(f"Falha ao atualizar saldo USDT: {e}")
 
-            strats = self.config['strategies'].get(symbol, [])
-            for strat_name in strats:
-                try:
-                    strategy = self.strategies.get_strategy(strat_name, symbol)
-                    signal = strategy.generate_signal()
-                    logger.info(f"[{symbol}] Estratégia {strat_name} => Sinal: {signal}")
-
-                    if self.config['mode'] == "trade" and signal in ["buy", "sell"]:
-                        # idempotência: evita duplicar sinal por candle
-                        if is_recent_signal(symbol, signal, candle_close_ts, ttl_sec=30):
-                            logger.warning(f"[{symbol}] Sinal {signal} ignorado (antirrepique).")
-                            continue
-                        add_recent_signal(symbol, signal, candle_close_ts, ttl_sec=30)
-
-                        if self._is_paused():
-                            logger.warning("⏸️  Trading pausado (pause.flag). Ignorando sinais.")
-                            continue
-
-                        usdt = self.client.get_asset_balance(asset='USDT')
-                        usdt_free = float(usdt['free']) if usdt else 0.0
-                        await asyncio.to_thread(self.exec.place_signal, symbol, signal, usdt_free)
-                except Exception as e:
-                    logger.exception(f"[{symbol}] Erro na estratégia {strat_name}: {e}")
-                    self.notifier.send(f"❌ [{symbol}] Erro estratégia {strat_name}: {e}")
+    async def _balance_poller(self):
+        """Saldo USDT livre em memória, renovado a cada BALANCE_REFRESH_SEC: sinais não esperam REST."""
+        while True:
+            await asyncio.sleep(BALANCE_REFRESH_SEC)
+            await self._refresh_balance()
 
     async def watchdog(self):
         """Reconecta se faltar mensagens OU se a timeframe.flag mudar."""
@@ -157,35 +239,47 @@ class WebSocketBot:
                     self._tf_last_mtime = mtime
                     raise ConnectionError("Timeframe changed")
 
+    def _streams(self) -> List[str]:
+        streams = self._streams_by_tf.get(self.timeframe)
+        if streams is None:
+            streams = self._streams_by_tf[self.timeframe] = [f"{s}@kline_{self.timeframe}" for s in self.symbols_lower]
+        return streams
+
     async def start(self):
-        backoff = 1
-        while True:
-            try:
-                streams = [f"{s}@kline_{self.timeframe}" for s in self.symbols_lower]
-                async with self.bsm.multiplex_socket(streams) as stream:
-                    logger.info(f"▶️  Streams ativos: {streams}")
-                    task_watchdog = asyncio.create_task(self.watchdog())
-                    while True:
-                        msg = await stream.recv()
-                        await self.handle_candles(msg)
-                        backoff = 1
-            except Exception as e:
-                logger.error(f"WS caiu: {e}. Reconnect em {backoff}s...")
-                await asyncio.sleep(backoff)
-                backoff = min(backoff * 2, 60)
-                # rebootstrap rápido no novo TF (últimos 200 candles)
+        # tarefas de fundo com handle próprio: canceladas direto, sem varrer o loop
+        self._bg_tasks = [asyncio.create_task(self._consumer()), asyncio.create_task(self._balance_poller())]
+        try:
+            backoff = 1
+            while True:
                 try:
-                    rest = BinanceClient()
-                    for sym in self.symbols_upper:
-                        self.mds.bootstrap_from_rest(rest.client, sym, self.timeframe, limit=200)
-                except Exception as be:
-                    logger.warning(f"Falha ao rebootstrap no novo TF: {be}")
-            finally:
-                # cancela watchdog
-                for t in asyncio.all_tasks():
-                    if t is not asyncio.current_task() and getattr(t.get_coro(), "__name__", "") == "watchdog":
-                        t.cancel()
+                    streams = self._streams()
+                    async with self.bsm.multiplex_socket(streams) as stream:
+                        logger.info(f"▶️  Streams ativos: {streams}")
+                        self._watchdog_task = asyncio.create_task(self.watchdog())
+                        while True:
+                            for msg in await self._drain(stream):
+                                await self.handle_candles(msg)
+                            backoff = 1
+                except Exception as e:
+                    logger.error(f"WS caiu: {e}. Reconnect em {backoff}s...")
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, 60)
+                    # rebootstrap rápido no novo TF (últimos 200 candles)
+                    try:
+                        # fora do event loop: o consumidor segue drenando a fila enquanto isso
+                        await asyncio.to_thread(self._bootstrap_all)
+                    except Exception as be:
+                        logger.warning(f"Falha ao rebootstrap no novo TF: {be}")
+                finally:
+                    # cancela watchdog
+                    if self._watchdog_task and not self._watchdog_task.done():
+                        self._watchdog_task.cancel()
+        finally:
+            for t in self._bg_tasks:
+                t.cancel()
 
 if __name__ == "__main__":
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
     bot = WebSocketBot()
     asyncio.run(bot.start())
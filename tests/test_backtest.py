@@ -0,0 +1,88 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import bot.backtest as backtest
+from bot.backtest import BacktestEngine
+
+_CFG = {
+    "symbols": ["BTCUSDT", "ETHUSDT"],
+    "timeframe": "1m",
+    "strategies": {"BTCUSDT": ["ema_cross", "rsi"], "ETHUSDT": ["ema_cross"]},
+    "ema_cross": {"fast_period": 5, "slow_period": 13},
+    "rsi": {"period": 14, "overbought": 65.0, "oversold": 35.0},
+    "risk": {
+        "capital_per_trade_pct": 5.0, "stop_loss_pct": 1.0, "take_profit_pct": 1.5,
+        "max_daily_loss_pct": 50.0, "max_trades_per_day": 1000,
+    },
+    "backtest": {"warmup": 50, "capital_inicial": 1000.0},
+}
+
+def _hist(seed: int, p0: float, n: int):
+    rng = np.random.default_rng(seed)
+    c = p0 * np.cumprod(1 + rng.normal(0, 0.004, n))
+    o = np.r_[p0, c[:-1]]
+    t = 1_700_000_000_000 + np.arange(n, dtype=np.int64) * 60_000
+    return {"t": t, "T": t + 59_999, "o": o, "h": np.maximum(o, c), "l": np.minimum(o, c),
+            "c": c, "v": np.ones(n)}
+
+class KernelLoopEquivalenceTest(unittest.TestCase):
+    """_simulate_kernel, o loop com séries pré-calculadas e o loop com generate_signal: mesmos trades."""
+
+    def setUp(self):
+        claimed = set()
+
+        def try_claim(symbol, side, candle, ttl_sec=30):
+            key = (symbol, side, candle)
+            if key in claimed:
+                return False
+            claimed.add(key)
+            return True
+
+        # nada de state.json / antirrepique global entre as execuções
+        for name, fn in (("set_last_tick_now", lambda *a: None), ("try_claim_signal", try_claim)):
+            patcher = mock.patch.object(backtest, name, fn)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self._claimed = claimed
+
+    def _engine(self) -> BacktestEngine:
+        self._claimed.clear()
+        with mock.patch.object(backtest.os, "makedirs"):
+            engine = BacktestEngine(_CFG)
+        engine.hist = {"BTCUSDT": _hist(1, 100.0, 600), "ETHUSDT": _hist(2, 10.0, 550)}
+        engine._bootstrap_warmup()
+        engine._precompute_signals()
+        trades = []
+        engine._record_trade = lambda *row: trades.append(row)
+        return engine, trades
+
+    def _loop(self, engine):
+        for _, si, li in engine._build_schedule().tolist():
+            engine._step_symbol(engine.symbols[si], li)
+
+    def test_kernel_matches_loops(self):
+        kernel, kernel_trades = self._engine()
+        kernel._run_kernel(kernel._build_schedule())
+
+        series, series_trades = self._engine()
+        self._loop(series)
+
+        incremental, incremental_trades = self._engine()
+        for s in incremental.symbols:
+            incremental._signals[s] = [(name, None) for name, _ in incremental._signals[s]]
+            incremental._needs_mds[s] = True
+        self._loop(incremental)
+
+        self.assertGreater(len(kernel_trades), 5)
+        for other in (series_trades, incremental_trades):
+            self.assertEqual(len(other), len(kernel_trades))
+            for a, b in zip(kernel_trades, other):
+                self.assertEqual((a[0], a[1], a[5], a[6]), (b[0], b[1], b[5], b[6]))
+                np.testing.assert_allclose(a[2:5], b[2:5], rtol=1e-12)
+        self.assertAlmostEqual(kernel.pnl_daily, series.pnl_daily, places=9)
+        self.assertAlmostEqual(kernel.pnl_daily, incremental.pnl_daily, places=9)
+
+if __name__ == "__main__":
+    unittest.main()
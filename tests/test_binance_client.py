@@ -0,0 +1,78 @@
+import time
+import unittest
+
+import requests
+
+from bot.binance_client import BinanceClient, PooledClient
+from bot.utils import CircuitBreaker, CircuitOpenError
+
+def _client(breaker: CircuitBreaker) -> BinanceClient:
+    # sem __init__: nada de config.yaml nem rede, só o _with_retries
+    bc = BinanceClient.__new__(BinanceClient)
+    bc.client = None
+    bc.breaker = breaker
+    return bc
+
+def _raise(exc):
+    def fn():
+        raise exc
+    return fn
+
+class HalfOpenProbeTest(unittest.TestCase):
+    """A chamada de teste do half-open sempre se resolve, mesmo com erro não classificado."""
+
+    def _tripped(self) -> BinanceClient:
+        breaker = CircuitBreaker("test", threshold=1, cooldown=0.01)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        time.sleep(0.02)
+        return _client(breaker)
+
+    def _assert_recovers(self, bc: BinanceClient, exc: Exception):
+        with self.assertRaises(type(exc)):
+            bc._with_retries(_raise(exc), _retries=0)
+        # antes do fix: _probing ficava True e tudo daqui em diante era CircuitOpenError
+        self.assertEqual(bc._with_retries(lambda: "ok", _retries=0), "ok")
+        self.assertEqual(bc.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_probe_raising_unexpected_exception(self):
+        self._assert_recovers(self._tripped(), ValueError("corpo inválido"))
+
+    def test_probe_raising_unclassified_request_exception(self):
+        self._assert_recovers(self._tripped(), requests.exceptions.ChunkedEncodingError("cortado"))
+
+    def test_open_circuit_still_refuses(self):
+        breaker = CircuitBreaker("test", threshold=1, cooldown=60)
+        breaker.record_failure()
+        with self.assertRaises(CircuitOpenError):
+            _client(breaker)._with_retries(lambda: "ok")
+
+class PooledSessionTest(unittest.TestCase):
+    """Cada Client com a sua API key; o pool de conexões é compartilhado e sobrevive ao close."""
+
+    @staticmethod
+    def _pooled(api_key: str) -> PooledClient:
+        # sem __init__: o Client original faz ping na rede
+        client = PooledClient.__new__(PooledClient)
+        client.API_KEY = api_key
+        client.session = client._init_session()
+        return client
+
+    def test_headers_are_per_client_and_pool_is_shared(self):
+        prod, test = self._pooled("prod-key"), self._pooled("test-key")
+        self.assertEqual(prod.session.headers["X-MBX-APIKEY"], "prod-key")
+        self.assertEqual(test.session.headers["X-MBX-APIKEY"], "test-key")
+        self.assertIs(prod.session.get_adapter("https://x"), test.session.get_adapter("https://x"))
+
+    def test_close_keeps_shared_pool_open(self):
+        prod, test = self._pooled("prod-key"), self._pooled("test-key")
+        adapter = test.session.get_adapter("https://x")
+        pools = adapter.poolmanager.pools
+        pools.clear()
+        adapter.poolmanager.connection_from_url("https://example.invalid")
+        prod.close_connection()
+        self.assertEqual(len(adapter.poolmanager.pools), 1)
+        self.assertIs(test.session.get_adapter("https://x"), adapter)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import copy
+import unittest
+
+from bot.config import ConfigError, _validate
+
+_BASE = {
+    "mode": "trade",
+    "symbols": ["BTCUSDT"],
+    "strategies": {"BTCUSDT": ["ema_cross", "rsi"]},
+    "ema_cross": {"fast_period": 9, "slow_period": 21},
+    "rsi": {"period": 14, "overbought": 70, "oversold": 30},
+    "risk": {
+        "capital_per_trade_pct": 5, "stop_loss_pct": 1.0, "take_profit_pct": 2.0,
+        "max_daily_loss_pct": 5.0, "max_trades_per_day": 10,
+    },
+}
+
+def _config(**sections):
+    config = copy.deepcopy(_BASE)
+    for name, values in sections.items():
+        config[name].update(values)
+    return config
+
+class ValidateTest(unittest.TestCase):
+    """_validate acumula tudo num ConfigError, nunca TypeError/KeyError no meio."""
+
+    def test_valid_config_is_coerced(self):
+        config = _config(ema_cross={"fast_period": "9"})
+        _validate(config)
+        self.assertEqual(config["ema_cross"]["fast_period"], 9)
+        self.assertIsInstance(config["rsi"]["overbought"], float)
+
+    def test_strategy_keys_are_normalized(self):
+        config = _config()
+        config["symbols"] = ["BTC/USDT"]
+        config["strategies"] = {"btc/usdt": ["rsi"]}
+        _validate(config)
+        self.assertEqual(config["strategies"], {"BTCUSDT": ["rsi"]})
+
+    def test_bad_type_reports_config_error(self):
+        config = _config(ema_cross={"fast_period": "x"}, rsi={"oversold": None})
+        with self.assertRaises(ConfigError) as ctx:
+            _validate(config)
+        msg = str(ctx.exception)
+        self.assertIn("ema_cross.fast_period", msg)
+        self.assertIn("rsi.oversold", msg)
+        # a checagem de ordem fica de fora quando o tipo já falhou
+        self.assertNotIn("menor que", msg)
+
+    def test_ordering_errors_are_aggregated(self):
+        config = _config(ema_cross={"fast_period": 30}, rsi={"oversold": 80})
+        with self.assertRaises(ConfigError) as ctx:
+            _validate(config)
+        msg = str(ctx.exception)
+        self.assertIn("fast_period deve ser menor que slow_period", msg)
+        self.assertIn("oversold deve ser menor que overbought", msg)
+
+if __name__ == "__main__":
+    unittest.main()
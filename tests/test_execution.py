@@ -0,0 +1,86 @@
+import unittest
+from unittest import mock
+
+from bot.execution import ExecutionService
+from bot.utils import CircuitBreaker
+
+class _Client:
+    """Dublê mínimo do BinanceClient para a reconciliação."""
+
+    def __init__(self, balance, trades):
+        self.breaker = CircuitBreaker("test")
+        self.balance = balance
+        self.trades = trades
+        self.full_fetches = 0
+
+    def get_symbol_info(self, symbol):
+        return {"baseAsset": "BTC"}
+
+    def get_balance(self, asset):
+        return self.balance
+
+    def get_my_trades(self, symbol, limit=100):
+        self.full_fetches += 1
+        return self.trades[-limit:]
+
+    def get_my_trades_since(self, symbol, from_id, limit=1000):
+        return [t for t in self.trades if t["id"] > from_id]
+
+def _trade(id_, qty, price, buy=True):
+    return {"id": id_, "qty": str(qty), "price": str(price), "isBuyer": buy}
+
+class ReconcileCursorTest(unittest.TestCase):
+    """Cursor (id, qty, pm) incremental e invalidado quando o saldo diverge."""
+
+    def setUp(self):
+        self.cursors = {}
+        for name, fn in (
+            ("get_trade_cursor", lambda s: dict(self.cursors.get(s, {}))),
+            ("save_trade_cursor", lambda s, i, q, p: self.cursors.__setitem__(s, {"id": i, "qty": q, "pm": p})),
+        ):
+            patcher = mock.patch(f"bot.execution.{name}", fn)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _service(self, client):
+        return ExecutionService(risk=None, client=client)
+
+    def test_incremental_buys_update_pm(self):
+        client = _Client(1.0, [_trade(1, 1.0, 100.0)])
+        svc = self._service(client)
+        svc.reconcile_for_symbol("BTCUSDT")
+        self.assertEqual(self.cursors["BTCUSDT"], {"id": 1, "qty": 1.0, "pm": 100.0})
+
+        client.trades.append(_trade(2, 1.0, 200.0))
+        client.balance = 2.0
+        svc.reconcile_for_symbol("BTCUSDT")
+        self.assertEqual(client.full_fetches, 1)  # segunda vez só os trades novos
+        self.assertEqual(self.cursors["BTCUSDT"], {"id": 2, "qty": 2.0, "pm": 150.0})
+        self.assertAlmostEqual(svc.last_buy_price["BTCUSDT"], 150.0)
+
+    def test_deposit_without_trades_invalidates_cursor(self):
+        client = _Client(1.0, [_trade(1, 1.0, 100.0)])
+        svc = self._service(client)
+        svc.reconcile_for_symbol("BTCUSDT")
+
+        client.balance = 3.0  # depósito: saldo sobe sem trade novo
+        svc.reconcile_for_symbol("BTCUSDT")
+        self.assertEqual(client.full_fetches, 2)  # reconstruiu do zero
+        self.assertEqual(self.cursors["BTCUSDT"]["qty"], 3.0)
+        self.assertAlmostEqual(self.cursors["BTCUSDT"]["pm"], 100.0 / 3.0)
+
+        # saldo estável de novo: cursor vale e não há nova reconstrução
+        svc.reconcile_for_symbol("BTCUSDT")
+        self.assertEqual(client.full_fetches, 2)
+
+    def test_withdrawal_to_zero_clears_pm(self):
+        client = _Client(1.0, [_trade(1, 1.0, 100.0)])
+        svc = self._service(client)
+        svc.reconcile_for_symbol("BTCUSDT")
+        client.balance = 0.0
+        svc.reconcile_for_symbol("BTCUSDT")
+        self.assertEqual(self.cursors["BTCUSDT"]["qty"], 0.0)
+        self.assertEqual(svc.last_buy_price["BTCUSDT"], 0.0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+from bot.market_data import MarketDataService, _Ring
+from bot.utils import stat_cached
+
+def _candles(start: int, n: int):
+    """n candles de 1m a partir do índice start: open_time/close_time em ms, close = índice."""
+    ot = (np.arange(start, start + n, dtype=np.int64)) * 60_000
+    c = np.arange(start, start + n, dtype=np.float64)
+    return ot, c, c, c, c, np.ones(n), ot + 59_999
+
+class RingWrapTest(unittest.TestCase):
+    """Ordem cronológica do buffer antes e depois de dar a volta."""
+
+    def test_append_wraps_in_order(self):
+        mds = MarketDataService(maxlen=5)
+        for i in range(8):
+            ot = i * 60_000
+            mds.on_candle_closed("BTCUSDT", "1m", ot, i, i, i, i, 1, ot + 59_999)
+        arrays = mds.get_arrays("btc/usdt", "1m")
+        np.testing.assert_array_equal(arrays["close"], [3, 4, 5, 6, 7])
+        self.assertTrue(np.all(np.diff(arrays["open_time"]) > 0))
+        self.assertEqual(mds.last_close("BTCUSDT"), 7.0)
+        self.assertEqual(mds.last_close_time("BTCUSDT"), 7 * 60_000 + 59_999)
+        np.testing.assert_array_equal(mds.last_n_closes("BTCUSDT", n=3), [5, 6, 7])
+
+    def test_bulk_load_wrap_and_overflow(self):
+        mds = MarketDataService(maxlen=5)
+        mds.bulk_load("BTCUSDT", "1m", *_candles(0, 3))
+        mds.bulk_load("BTCUSDT", "1m", *_candles(3, 4))  # dá a volta no meio
+        np.testing.assert_array_equal(mds.get_arrays("BTCUSDT")["close"], [2, 3, 4, 5, 6])
+        mds.bulk_load("BTCUSDT", "1m", *_candles(7, 12))  # mais que maxlen: só os últimos
+        np.testing.assert_array_equal(mds.get_arrays("BTCUSDT")["close"], [14, 15, 16, 17, 18])
+        np.testing.assert_array_equal(mds.last_n_closes("BTCUSDT", n=10), [14, 15, 16, 17, 18])
+
+    def test_empty_buffer(self):
+        mds = MarketDataService(maxlen=5)
+        self.assertEqual(len(mds.get_arrays("BTCUSDT")["close"]), 0)
+        self.assertIsNone(mds.last_close("BTCUSDT"))
+        self.assertEqual(len(mds.last_n_closes("BTCUSDT")), 0)
+
+class SharedMemoryTest(unittest.TestCase):
+    """Escritor e leitor no mesmo diretório (memmap), com seqlock."""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        stat_cached.cache_clear()
+
+    def test_reader_sees_writer_wrap(self):
+        writer = MarketDataService(maxlen=4, shm_dir=self.dir.name)
+        writer.bulk_load("BTCUSDT", "1m", *_candles(0, 6))
+        reader = MarketDataService(shm_dir=self.dir.name, readonly=True)
+        np.testing.assert_array_equal(reader.get_arrays("BTCUSDT")["close"], [2, 3, 4, 5])
+        writer.on_candle_closed("BTCUSDT", "1m", *(c[0] for c in _candles(6, 1)))
+        np.testing.assert_array_equal(reader.get_arrays("BTCUSDT")["close"], [3, 4, 5, 6])
+        self.assertEqual(reader.last_close("BTCUSDT"), 6.0)
+
+    def test_writer_restart_keeps_file_and_resets_count(self):
+        writer = MarketDataService(maxlen=4, shm_dir=self.dir.name)
+        writer.bulk_load("BTCUSDT", "1m", *_candles(0, 3))
+        reader = MarketDataService(shm_dir=self.dir.name, readonly=True)
+        self.assertEqual(reader.last_close("BTCUSDT"), 2.0)
+        # novo escritor, mesmo tamanho: sem truncar; o leitor já anexado vê buffer vazio
+        MarketDataService(maxlen=4, shm_dir=self.dir.name)._ring("BTCUSDT", "1m")
+        self.assertIsNone(reader.last_close("BTCUSDT"))
+
+    def test_reader_reattaches_when_writer_resizes(self):
+        MarketDataService(maxlen=4, shm_dir=self.dir.name).bulk_load("BTCUSDT", "1m", *_candles(0, 4))
+        reader = MarketDataService(shm_dir=self.dir.name, readonly=True)
+        self.assertEqual(len(reader.get_arrays("BTCUSDT")["close"]), 4)
+        MarketDataService(maxlen=8, shm_dir=self.dir.name).bulk_load("BTCUSDT", "1m", *_candles(0, 8))
+        stat_cached.cache_clear()
+        np.testing.assert_array_equal(reader.get_arrays("BTCUSDT")["close"], np.arange(8))
+
+    def test_read_retries_when_writer_updates_mid_copy(self):
+        writer = MarketDataService(maxlen=4, shm_dir=self.dir.name)
+        writer.bulk_load("BTCUSDT", "1m", *_candles(0, 4))
+        ring = MarketDataService(shm_dir=self.dir.name, readonly=True)._find("BTCUSDT", "1m")
+        calls = []
+
+        def racing_view(r: _Ring):
+            out = r.view()
+            if not calls:
+                # escritor avança no meio da primeira cópia: seq muda, read() refaz
+                writer.on_candle_closed("BTCUSDT", "1m", *(c[0] for c in _candles(4, 1)))
+            calls.append(out)
+            return out
+
+        out = ring.read(racing_view)
+        self.assertEqual(len(calls), 2)
+        np.testing.assert_array_equal(out["close"], [1, 2, 3, 4])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import queue
+import unittest
+
+from bot import notifier
+from bot.notifier import NOTIFY_BATCH_MAX, TELEGRAM_MAX_CHARS, Notifier
+
+class _Bot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        self.sent.append(text)
+
+def _drain(*messages):
+    # sem __init__: nada de token nem thread; roda o worker até o _STOP
+    n = Notifier.__new__(Notifier)
+    n.bot, n.chat_id, n._q = _Bot(), 1, queue.Queue()
+    for m in messages + (notifier._STOP,):
+        n._q.put(m)
+    n._worker()
+    return n.bot.sent
+
+class BatchSplitTest(unittest.TestCase):
+    """Lotes respeitam o limite do Telegram sem perder mensagens."""
+
+    def test_overflow_is_carried_to_next_send(self):
+        errors = [f"❌ erro {i} " + "x" * 300 for i in range(19)]
+        sent = _drain(*errors, "🔴 SELL BTCUSDT PnL=+1.23")
+        self.assertGreater(len(sent), 1)
+        self.assertTrue(all(len(text) <= TELEGRAM_MAX_CHARS for text in sent))
+        self.assertEqual("\n".join(sent).split("\n"), errors + ["🔴 SELL BTCUSDT PnL=+1.23"])
+
+    def test_only_oversized_single_message_is_truncated(self):
+        sent = _drain("a", "y" * (TELEGRAM_MAX_CHARS + 100), "b")
+        self.assertEqual(sent, ["a", "y" * TELEGRAM_MAX_CHARS, "b"])
+
+    def test_batch_count_limit(self):
+        sent = _drain(*(str(i) for i in range(NOTIFY_BATCH_MAX + 5)))
+        self.assertEqual([len(text.split("\n")) for text in sent], [NOTIFY_BATCH_MAX, 5])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+
+import numpy as np
+
+from bot.market_data import MarketDataService
+from bot.strategies import SIGNAL_NAMES, EMACrossStrategy, RSIStrategy
+
+def _closes(seed: int, n: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return 100.0 * np.cumprod(1 + rng.normal(0, 0.005, n))
+
+class IncrementalMatchesVectorizedTest(unittest.TestCase):
+    """generate_signal (O(1) por candle) dá o mesmo sinal que signal_series em cada índice."""
+
+    def _check(self, make, closes, warmup=40, maxlen=64):
+        # maxlen pequeno: o buffer dá a volta várias vezes no meio do teste
+        mds = MarketDataService(maxlen=maxlen)
+        strategy = make(mds)
+        expected = [SIGNAL_NAMES[s] for s in strategy.signal_series(closes).tolist()]
+        t = np.arange(len(closes), dtype=np.int64) * 60_000
+        mds.bulk_load("BTCUSDT", "1m", t[:warmup], closes[:warmup], closes[:warmup], closes[:warmup],
+                      closes[:warmup], np.ones(warmup), t[:warmup] + 59_999)
+        got = []
+        for i in range(warmup, len(closes)):
+            c = closes[i]
+            mds.on_candle_closed("BTCUSDT", "1m", t[i], c, c, c, c, 1.0, t[i] + 59_999)
+            got.append(strategy.generate_signal())
+        self.assertEqual(got, expected[warmup:])
+        self.assertIn("buy", got)
+        self.assertIn("sell", got)
+
+    def test_ema_cross(self):
+        self._check(lambda mds: EMACrossStrategy("BTCUSDT", 5, 13, mds), _closes(1, 400))
+
+    def test_rsi(self):
+        self._check(lambda mds: RSIStrategy("BTCUSDT", 14, 60.0, 40.0, mds), _closes(2, 400))
+
+    def test_skipped_candles_are_caught_up(self):
+        closes = _closes(3, 200)
+        mds = MarketDataService(maxlen=256)
+        strategy = EMACrossStrategy("BTCUSDT", 5, 13, mds)
+        expected = SIGNAL_NAMES[int(strategy.signal_series(closes)[-1])]
+        t = np.arange(len(closes), dtype=np.int64) * 60_000
+        mds.bulk_load("BTCUSDT", "1m", t[:100], closes[:100], closes[:100], closes[:100], closes[:100],
+                      np.ones(100), t[:100] + 59_999)
+        strategy.generate_signal()
+        # vários candles entram antes da próxima avaliação (ex.: lote do consumidor)
+        mds.bulk_load("BTCUSDT", "1m", t[100:], closes[100:], closes[100:], closes[100:], closes[100:],
+                      np.ones(100), t[100:] + 59_999)
+        self.assertEqual(strategy.generate_signal(), expected)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,9 @@
-from flask import Flask, render_template_string, redirect, request, url_for
+from flask import Flask, render_template, redirect, request, url_for
 import time
 import os
 from bot.state import get as get_state
-from bot.config import load_config
+from bot.config import CONFIG_PATH, ConfigError, load_config
+from bot.utils import read_flag, stat_cached
 
 PAUSE_FLAG = os.getenv("BOT_PAUSE_FLAG", "pause.flag")
 TF_FLAG = os.getenv("BOT_TIMEFRAME_FLAG", "timeframe.flag")
@@ -96,23 +97,40 @@ TPL = """
 </body>
 </html>
 """
+# compilado uma vez; render_template_string reparseia o texto a cada request
+_TPL = app.jinja_env.from_string(TPL)
+
+_cfg_cache = {"mtime": None, "cfg": None}
+
+def _cached_cfg():
+    """
+    load_config() é memoizado no processo; aqui recarrega só quando o
+    config.yaml muda no disco (mtime). Se a nova versão for inválida,
+    segue com a última boa.
+    """
+    st = stat_cached(CONFIG_PATH)
+    mtime = st.st_mtime if st else None
+    if _cfg_cache["cfg"] is None or mtime != _cfg_cache["mtime"]:
+        load_config.cache_clear()
+        try:
+            _cfg_cache["cfg"] = load_config()
+        except (OSError, ConfigError):
+            if _cfg_cache["cfg"] is None:
+                raise
+        _cfg_cache["mtime"] = mtime
+    return _cfg_cache["cfg"]
 
 def _current_timeframe(cfg):
     # prioridade: flag > config.yaml
-    if os.path.exists(TF_FLAG):
-        try:
-            with open(TF_FLAG, "r") as f:
-                tf = f.read().strip()
-            if tf:
-                return tf
-        except Exception:
-            pass
+    tf = read_flag(TF_FLAG)
+    if tf:
+        return tf
     return (cfg.get("timeframe") or "1m").strip()
 
 @app.route("/")
 def index():
     st = get_state()
-    cfg = load_config()
+    cfg = _cached_cfg()
     timeframe = _current_timeframe(cfg)
 
     now = int(time.time())
@@ -126,14 +144,14 @@ def index():
     pnl = float(st.get("pnl_daily", 0.0))
     pnl_cls = "ok" if pnl > 0 else ("bad" if pnl < 0 else "")
 
-    paused = os.path.exists(PAUSE_FLAG)
+    paused = stat_cached(PAUSE_FLAG) is not None
 
-    # prepara a lista de trades para o template (junta reverse + slice aqui)
+    # últimos 30 trades, mais novo primeiro: fatia antes de inverter (O(30), não O(N))
     trades = st.get("trades", []) or []
-    trades_view = list(reversed(trades))[:30]
+    trades_view = trades[-30:][::-1]
 
-    return render_template_string(
-        TPL,
+    return render_template(
+        _TPL,
         st=st,
         time=time,
         uptime_str=uptime_str,
@@ -146,10 +164,17 @@ def index():
         trades_view=trades_view,
     )
 
+def _invalidate_caches():
+    """Após escrever uma flag: próxima leitura vê o estado novo (sem esperar os TTLs)."""
+    global _metrics_cache
+    stat_cached.cache_clear()
+    _metrics_cache = (0.0, b"")
+
 @app.route("/pause")
 def pause():
     with open(PAUSE_FLAG, "w") as f:
         f.write("1\n")
+    _invalidate_caches()
     return redirect("/")
 
 @app.route("/resume")
@@ -159,6 +184,7 @@ def resume():
             os.remove(PAUSE_FLAG)
     except Exception:
         pass
+    _invalidate_caches()
     return redirect("/")
 
 @app.route("/timeframe", methods=["POST"])
@@ -168,36 +194,58 @@ def set_timeframe():
         return redirect(url_for("index"))
     with open(TF_FLAG, "w") as f:
         f.write(tf + "\n")
+    _invalidate_caches()
     # O WS vai detectar e reconectar no novo TF
     return redirect(url_for("index"))
 
+# só os valores mudam entre scrapes: HELP/TYPE ficam pré-codificados em bytes
+_METRICS_TMPL = (
+    "# HELP bot_up 1 se o processo do painel está ativo\n"
+    "# TYPE bot_up gauge\n"
+    "bot_up 1\n"
+    "# HELP bot_paused 1 se trading está pausado\n"
+    "# TYPE bot_paused gauge\n"
+    "bot_paused %d\n"
+    "# HELP bot_last_tick_age_seconds Idade do último tick (segundos)\n"
+    "# TYPE bot_last_tick_age_seconds gauge\n"
+    "bot_last_tick_age_seconds %d\n"
+    "# HELP bot_pnl_daily_usdt PnL diário em USDT (estimado)\n"
+    "# TYPE bot_pnl_daily_usdt gauge\n"
+    "bot_pnl_daily_usdt %r\n"
+).encode("utf-8")
+_METRICS_HEADERS = {"Content-Type": "text/plain; version=0.0.4"}
+
+# scrapes dentro dessa janela (vários Prometheus, retries) recebem o mesmo corpo
+METRICS_TTL_SEC = 1.0
+_metrics_cache = (0.0, b"")  # (time.monotonic() da montagem, corpo)
+
 @app.route("/metrics")
 def metrics():
+    global _metrics_cache
+    built_at, body = _metrics_cache
+    if body and time.monotonic() - built_at < METRICS_TTL_SEC:
+        return body, 200, _METRICS_HEADERS
+
     st = get_state()
     now = int(time.time())
     last_tick_ts = int(st.get("last_tick_ts", 0))
     last_tick_age = (now - last_tick_ts) if last_tick_ts else 999999
-    paused = 1 if os.path.exists(PAUSE_FLAG) else 0
+    paused = 1 if stat_cached(PAUSE_FLAG) else 0
 
-    lines = []
-    lines.append("# HELP bot_up 1 se o processo do painel está ativo")
-    lines.append("# TYPE bot_up gauge")
-    lines.append("bot_up 1")
+    # %r => repr(float), mesmo texto que o f-string anterior
+    body = _METRICS_TMPL % (paused, last_tick_age, float(st.get("pnl_daily", 0.0)))
+    _metrics_cache = (time.monotonic(), body)
+    return body, 200, _METRICS_HEADERS
 
-    lines.append("# HELP bot_paused 1 se trading está pausado")
-    lines.append("# TYPE bot_paused gauge")
-    lines.append(f"bot_paused {paused}")
-
-    lines.append("# HELP bot_last_tick_age_seconds Idade do último tick (segundos)")
-    lines.append("# TYPE bot_last_tick_age_seconds gauge")
-    lines.append(f"bot_last_tick_age_seconds {last_tick_age}")
-
-    lines.append("# HELP bot_pnl_daily_usdt PnL diário em USDT (estimado)")
-    lines.append("# TYPE bot_pnl_daily_usdt gauge")
-    lines.append(f"bot_pnl_daily_usdt {float(st.get('pnl_daily', 0.0))}")
-
-    return "\n".join(lines), 200, {"Content-Type": "text/plain; version=0.0.4"}
+# threads do waitress atendendo requests (painel + scrapes do Prometheus)
+DASHBOARD_THREADS = int(os.getenv("BOT_DASHBOARD_THREADS", "4"))
 
 if __name__ == "__main__":
     # Se quiser rodar direto: python -m web.dashboard (recomendado)
-    app.run(host="0.0.0.0", port=5000)
+    try:
+        from waitress import serve
+    except ImportError:
+        # sem waitress: servidor de desenvolvimento do Werkzeug
+        app.run(host="0.0.0.0", port=5000)
+    else:
+        serve(app, host="0.0.0.0", port=5000, threads=DASHBOARD_THREADS)